@@ -1,5 +1,6 @@
 from flask import Flask, jsonify
 from flask_cors import CORS
+from datetime import date
 import os
 
 # Import blueprints
@@ -7,50 +8,92 @@ from routes.patients import patients_bp
 from routes.dashboard import dashboard_bp
 from routes.predict import predict_bp
 from routes.notes import notes_bp
+from routes.jobs import jobs_bp
+from routes.registry import registry_bp
+from ml.risk_predictor import predictor
+from ml.nlp_analyzer import analyzer
 
-# Initialize database on startup
-from models.database import init_database
-init_database()
-print("✅ Database initialized")
+from models.database import init_database, init_app as init_db_app
+from models.jobs import recover_interrupted_jobs
 
-app = Flask(__name__)
-CORS(app, resources={
-    r"/*": {
-        "origins": "*",
-        "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization"]
-    }
-})
+def preload_models():
+    """Load and warm up the risk model and spaCy pipeline before serving requests"""
+    predictor.ensure_loaded()
+    analyzer.ensure_loaded()
+    # First calls pull in the rest of the scikit-learn / spaCy code paths
+    predictor.predict({'age': 65, 'admission_date': date.today().isoformat(), 'diagnosis': 'Pneumonia'})
+    analyzer.analyze_note('Warm-up note: chest pain, started on aspirin 81mg.')
+    print("✅ Models preloaded")
 
-# Configuration
-app.config['DATABASE'] = 'healthcare.db'
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key')
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
-
-# Register blueprints
-app.register_blueprint(patients_bp)
-app.register_blueprint(dashboard_bp)
-app.register_blueprint(predict_bp)
-app.register_blueprint(notes_bp)
-
-@app.route('/api/health', methods=['GET'])
-def health_check():
-    return jsonify({'status': 'healthy', 'message': 'Healthcare Analytics API is running'})
-
-@app.route('/', methods=['GET'])
-def root():
-    return jsonify({
-        'name': 'Healthcare Analytics API',
-        'version': '1.0.0',
-        'status': 'running',
-        'endpoints': {
-            'health': '/api/health',
-            'patients': '/api/patients',
-            'dashboard': '/api/dashboard/metrics',
-            'upload': '/api/data/upload',
-            'demo': '/api/data/load-demo'
+def create_app(preload=None):
+    """Create and configure the Flask application
+    
+    preload (default: the PRELOAD_MODELS environment variable) loads the
+    models before returning; otherwise they load on first use, so workers
+    boot and pass health checks fast. Under gunicorn with preload_app (see
+    gunicorn.conf.py) this runs once in the master, and forked workers
+    share the loaded models copy-on-write instead of each loading their own.
+    """
+    # Initialize database on startup
+    init_database()
+    print("✅ Database initialized")
+    
+    # Jobs left queued/running by a dead worker will never finish
+    recover_interrupted_jobs()
+    
+    if preload is None:
+        preload = os.environ.get('PRELOAD_MODELS', '').lower() in ('1', 'true', 'yes')
+    if preload:
+        preload_models()
+    
+    app = Flask(__name__)
+    init_db_app(app)
+    CORS(app, resources={
+        r"/*": {
+            "origins": "*",
+            "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+            "allow_headers": ["Content-Type", "Authorization"],
+            "expose_headers": ["X-Next-Cursor"]
         }
     })
+    
+    # Configuration
+    app.config['DATABASE'] = 'healthcare.db'
+    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key')
+    # Uploads are streamed to disk and ingested in batches, so large extracts are fine
+    app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_UPLOAD_BYTES', 4 * 1024 * 1024 * 1024))  # 4GB default
+    
+    # Register blueprints
+    app.register_blueprint(patients_bp)
+    app.register_blueprint(dashboard_bp)
+    app.register_blueprint(predict_bp)
+    app.register_blueprint(notes_bp)
+    app.register_blueprint(jobs_bp)
+    app.register_blueprint(registry_bp)
+    
+    @app.route('/api/health', methods=['GET'])
+    def health_check():
+        return jsonify({'status': 'healthy', 'message': 'Healthcare Analytics API is running'})
+    
+    @app.route('/', methods=['GET'])
+    def root():
+        return jsonify({
+            'name': 'Healthcare Analytics API',
+            'version': '1.0.0',
+            'status': 'running',
+            'endpoints': {
+                'health': '/api/health',
+                'patients': '/api/patients',
+                'dashboard': '/api/dashboard/metrics',
+                'upload': '/api/data/upload',
+                'demo': '/api/data/load-demo',
+                'jobs': '/api/jobs/<job_id>'
+            }
+        })
+    
+    return app
+
+app = create_app()
 
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
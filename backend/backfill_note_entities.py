@@ -0,0 +1,32 @@
+"""
+Store extracted entities for every clinical note in the database
+Run this after loading notes, or after changing the NLP analyzer
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from models.database import init_database, get_db_connection
+from ml.note_entities import backfill_note_entities, prune_note_analyses
+from ml.nlp_analyzer import analyzer
+
+def backfill():
+    """Analyze notes that have no stored entities for the current analyzer"""
+    print(f"📝 Backfilling note entities (analyzer {analyzer.version})...")
+    
+    init_database()
+    conn = get_db_connection()
+    
+    def progress(current, total):
+        print(f"   {current}/{total} notes")
+    
+    analyzed = backfill_note_entities(conn, progress=progress)
+    pruned = prune_note_analyses(conn)
+    conn.close()
+    
+    print(f"✅ Stored entities for {analyzed} notes, pruned {pruned} unused analyses")
+    return analyzed
+
+if __name__ == '__main__':
+    backfill()
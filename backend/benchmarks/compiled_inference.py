@@ -0,0 +1,196 @@
+"""
+Compiled inference benchmark: checks that ml.compiled_model matches sklearn's
+predict_proba for every candidate, compiled on scaled features and fused
+with the scaler, then compares the latency of scaler + sklearn, scaler +
+compiled and fused (raw features) for batches of 1, 100 and 100k rows
+
+With --check it only checks parity, for every candidate and search-space
+configuration, on the scoring rows, the training rows and rows placed on
+and next to every fused split threshold, also after training on values
+one float32 step apart once scaled (so thresholds sit on training
+values); it exits 1 on any mismatch.
+
+Usage: python benchmarks/compiled_inference.py [--train-rows N] [--repeat N] [--check]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from ml.compiled_model import CompiledLinearModel, compile_model, export_fused_model
+from ml.model_selection import build_estimator, expand_search_space
+from ml.risk_predictor import MODEL_CANDIDATES, SEARCH_SPACES, predictor
+
+BATCH_SIZES = [1, 100, 100000]
+
+DIAGNOSES = list(predictor.diagnosis_risk_map)
+
+# Largest difference from predict_proba allowed for logistic regression,
+# which is only equal to float rounding; tree models must match exactly
+LINEAR_TOLERANCE = 1e-12
+
+def synthetic_patients(n, rng):
+    """Random patient rows shaped like the patients/vitals join"""
+    admission_days = rng.integers(0, 365, n)
+    stay_days = rng.integers(1, 30, n)
+    return [
+        {
+            'age': int(rng.integers(18, 95)),
+            'previous_admissions': int(rng.integers(0, 6)),
+            'comorbidities': int(rng.integers(0, 6)),
+            'heart_rate': int(rng.integers(50, 130)),
+            'blood_pressure_systolic': int(rng.integers(90, 180)),
+            'blood_pressure_diastolic': int(rng.integers(55, 110)),
+            'temperature': round(float(rng.uniform(36.0, 39.5)), 1),
+            'oxygen_saturation': int(rng.integers(85, 100)),
+            'admission_date': str(np.datetime64('2024-01-01') + admission),
+            'discharge_date': str(np.datetime64('2024-01-01') + admission + stay),
+            'diagnosis': DIAGNOSES[int(rng.integers(len(DIAGNOSES)))]
+        }
+        for admission, stay in zip(admission_days, stay_days)
+    ]
+
+def best_time(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def threshold_rows(fused, X):
+    """Rows of X with one split feature set to, and one float step either side of, each fused threshold"""
+    is_split = fused.left != np.arange(len(fused.threshold))
+    features = fused.feature[is_split]
+    thresholds = fused.threshold[is_split]
+    rows = []
+    for values in (np.nextafter(thresholds, -np.inf), thresholds, np.nextafter(thresholds, np.inf)):
+        probe = X[np.arange(len(values)) % len(X)].copy()
+        probe[np.arange(len(values)), features] = values
+        rows.append(probe)
+    return np.concatenate(rows)
+
+def parity_failures(model, scaler, X):
+    """Descriptions of every way compile_model/export_fused_model disagree with predict_proba on X"""
+    compiled = compile_model(model)
+    fused = export_fused_model(model, scaler)
+    if compiled is None:
+        return []
+    if fused is None:
+        return ['compile_model succeeded but export_fused_model returned None']
+    
+    if not isinstance(fused, CompiledLinearModel):
+        X = np.concatenate([X, threshold_rows(fused, X)])
+    expected = model.predict_proba(scaler.transform(X))[:, 1]
+    tolerance = LINEAR_TOLERANCE if isinstance(fused, CompiledLinearModel) else 0.0
+    
+    failures = []
+    for label, actual in (
+        ('compiled', compiled.predict_proba(scaler.transform(X))),
+        ('fused', fused.predict_proba(X))
+    ):
+        difference = np.abs(expected - actual)
+        if difference.max() > tolerance:
+            failures.append(f'{label}: {(difference > tolerance).sum()} of {len(X)} rows differ, '
+                            f'by up to {difference.max():.1e}')
+    return failures
+
+def check(X_train, y_train, X_score):
+    """Check parity for every candidate configuration; returns the number of failures"""
+    from sklearn.preprocessing import StandardScaler
+    
+    # Half the temperatures moved up one float32 step once scaled and labelled
+    # high risk, so the trees split between adjacent float32 training values,
+    # where sklearn puts the threshold on the lower value itself
+    temperature = predictor.feature_names.index('temperature')
+    mean, scale = X_train[:, temperature].mean(), X_train[:, temperature].std()
+    scaled = ((X_train[::2, temperature] - mean) / scale).astype(np.float32)
+    X_tied = X_train.copy()
+    X_tied[::2, temperature] = np.nextafter(scaled, np.float32(np.inf)).astype(np.float64) * scale + mean
+    y_tied = y_train.copy()
+    y_tied[::2] = 1
+    
+    failed = 0
+    for data_name, X, y in (('synthetic', X_train, y_train), ('one-step ties', X_tied, y_tied)):
+        scaler = StandardScaler().fit(X)
+        X_scaled = scaler.transform(X)
+        for name, (estimator_path, params) in MODEL_CANDIDATES.items():
+            for config in expand_search_space(params, SEARCH_SPACES.get(name)):
+                model = build_estimator(estimator_path, config).fit(X_scaled, y)
+                searched = {param: config[param] for param in SEARCH_SPACES.get(name, {})}
+                failures = parity_failures(model, scaler, np.concatenate([X_score, X]))
+                for failure in failures:
+                    print(f"❌ {name} {searched} ({data_name}) {failure}")
+                if not failures:
+                    print(f"✅ {name} {searched} ({data_name})")
+                failed += len(failures)
+    return failed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--train-rows', type=int, default=20000, help='synthetic patients to train on')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per batch size (best is reported)')
+    parser.add_argument('--check', action='store_true', help='only check parity; exit 1 on any mismatch')
+    args = parser.parse_args()
+    
+    from sklearn.preprocessing import StandardScaler
+    
+    rng = np.random.default_rng(42)
+    print(f"⏳ Building {args.train_rows} training and {max(BATCH_SIZES)} scoring rows...")
+    X_train, _ = predictor.extract_feature_matrix(synthetic_patients(args.train_rows, rng))
+    noise = rng.normal(scale=8, size=len(X_train))
+    y_train = (predictor.calculate_risk_scores(X_train) + noise >= 60).astype(int)
+    X_score, _ = predictor.extract_feature_matrix(synthetic_patients(max(BATCH_SIZES), rng))
+    
+    if args.check:
+        failed = check(X_train, y_train, X_score)
+        if failed:
+            print(f"\n❌ {failed} parity failures")
+            sys.exit(1)
+        print("\n✅ Compiled and fused models match predict_proba")
+        return
+    
+    scaler = StandardScaler().fit(X_train)
+    X_train_scaled = scaler.transform(X_train)
+    
+    header = f"{'model':<20}{'compiled':>10}{'fused':>10}" + ''.join(
+        f"{f'{size} rows sk/compiled/fused (ms)':>38}" for size in BATCH_SIZES
+    )
+    print('\n' + header)
+    
+    for name, (estimator_path, params) in MODEL_CANDIDATES.items():
+        model = build_estimator(estimator_path, params).fit(X_train_scaled, y_train)
+        compiled = compile_model(model)
+        fused = export_fused_model(model, scaler)
+        if compiled is None:
+            print(f"{name:<20}{'n/a':>10}{'n/a':>10}  (served by sklearn)")
+            continue
+        
+        expected = model.predict_proba(scaler.transform(X_score))[:, 1]
+        parities = [
+            'exact' if np.array_equal(expected, actual) else f'{np.abs(expected - actual).max():.1e}'
+            for actual in (compiled.predict_proba(scaler.transform(X_score)), fused.predict_proba(X_score))
+        ]
+        
+        cells = []
+        for size in BATCH_SIZES:
+            batch = X_score[:size]
+            timings = [
+                best_time(lambda: model.predict_proba(scaler.transform(batch)), args.repeat),
+                best_time(lambda: compiled.predict_proba(scaler.transform(batch)), args.repeat),
+                best_time(lambda: fused.predict_proba(batch), args.repeat)
+            ]
+            cells.append(' / '.join(f'{timing * 1000:.3f}' for timing in timings))
+        print(f"{name:<20}{parities[0]:>10}{parities[1]:>10}" + ''.join(f"{cell:>38}" for cell in cells))
+    
+    print("\ncompiled/fused: largest difference from scaler + predict_proba(X)[:, 1] over all scoring rows")
+    print("(exact = bit-identical); every timing includes scaling the raw feature matrix where needed")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Explanation benchmark: checks that each candidate's feature contributions
+(ml.compiled_model contributions()) add up to its prediction, then compares
+the scoring step of predict_many with and without the model's top-k risk
+factors (ml.explanations) for batches of 1, 100 and 100k rows
+
+Usage: python benchmarks/explanations.py [--train-rows N] [--repeat N]
+"""
+
+import argparse
+import os
+import sys
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.compiled_inference import best_time, synthetic_patients
+from ml.compiled_model import CompiledLinearModel
+from ml.model_selection import build_estimator
+from ml.risk_predictor import MODEL_CANDIDATES, make_active_model, predictor
+
+BATCH_SIZES = [1, 100, 100000]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--train-rows', type=int, default=20000, help='synthetic patients to train on')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per batch size (best is reported)')
+    args = parser.parse_args()
+    
+    from scipy.special import logit
+    from sklearn.preprocessing import StandardScaler
+    
+    rng = np.random.default_rng(42)
+    print(f"⏳ Building {args.train_rows} training and {max(BATCH_SIZES)} scoring rows...")
+    X_train, _ = predictor.extract_feature_matrix(synthetic_patients(args.train_rows, rng))
+    noise = rng.normal(scale=8, size=len(X_train))
+    y_train = (predictor.calculate_risk_scores(X_train) + noise >= 60).astype(int)
+    X_score, diagnoses = predictor.extract_feature_matrix(synthetic_patients(max(BATCH_SIZES), rng))
+    diagnoses = diagnoses.tolist()
+    
+    scaler = StandardScaler().fit(X_train)
+    
+    header = f"{'model':<20}{'additivity':>12}" + ''.join(
+        f"{f'{size} rows score/+explain (ms)':>34}" for size in BATCH_SIZES
+    )
+    print('\n' + header)
+    
+    for name, (estimator_path, params) in MODEL_CANDIDATES.items():
+        model = build_estimator(estimator_path, params).fit(scaler.transform(X_train), y_train)
+        active = make_active_model(model, scaler, name, 'benchmark', {})
+        fused = active.fused
+        if fused is None:
+            print(f"{name:<20}{'n/a':>12}  (no contributions)")
+            continue
+        
+        # Forests and single trees add up in probability, boosting and logistic regression in log-odds
+        expected = fused.predict_proba(X_score)
+        if isinstance(fused, CompiledLinearModel) or fused.combine == 'boosting':
+            expected = logit(expected)
+        additivity = np.abs(fused.baseline() + fused.contributions(X_score).sum(axis=1) - expected).max()
+        
+        cells = []
+        for size in BATCH_SIZES:
+            batch = X_score[:size]
+            timings = [
+                best_time(lambda: predictor._risk_probabilities(active, batch), args.repeat),
+                best_time(lambda: predictor._score_and_explain(active, batch, diagnoses[:size]), args.repeat)
+            ]
+            cells.append(' / '.join(f'{timing * 1000:.3f}' for timing in timings))
+        print(f"{name:<20}{additivity:>12.1e}" + ''.join(f"{cell:>34}" for cell in cells))
+    
+    print("\nadditivity: largest |baseline + sum of contributions - prediction| over all scoring rows")
+    print("+explain: scoring plus contributions and worded top-k factors for every row, as predict_many does")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Query plan check: builds a database of synthetic patients in a temporary
+directory, runs models.database audit_query_plans over HOT_QUERIES and
+exits non-zero if any hot query scans instead of seeking an index
+
+Usage: python benchmarks/query_plans.py [--patients N]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from models import database
+
+RISK_LEVELS = ['low', 'medium', 'high']
+
+def seed_patients(conn, n, rng):
+    """Insert n synthetic patients (every tenth unscored) and refresh the planner statistics"""
+    scores = rng.uniform(0, 100, n).round(1).tolist()
+    days = rng.integers(0, 365, n).tolist()
+    conn.executemany(
+        '''
+            INSERT INTO patients (patient_id, name, age, admission_date, diagnosis, risk_score, risk_level)
+            VALUES (?, ?, ?, date('2024-01-01', ? || ' days'), 'Pneumonia', ?, ?)
+        ''',
+        [
+            # Every tenth patient is unscored, as after a failed rescore
+            (f'P{i:06d}', f'Patient {i}', 60, day, None if i % 10 == 0 else score, RISK_LEVELS[i % 3])
+            for i, (score, day) in enumerate(zip(scores, days))
+        ]
+    )
+    conn.commit()
+    conn.execute('ANALYZE')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--patients', type=int, default=20000, help='synthetic patients to plan against')
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as workdir:
+        database.DATABASE_PATH = os.path.join(workdir, 'healthcare.db')
+        database.init_database()
+        
+        conn = database.get_db_connection()
+        seed_patients(conn, args.patients, np.random.default_rng(42))
+        failures = database.audit_query_plans(conn)
+        conn.close()
+    
+    for name, detail in failures:
+        print(f"❌ {name}: {detail}")
+    if failures:
+        sys.exit(1)
+    print(f"✅ All {len(database.HOT_QUERIES)} hot queries seek an index or stop at their LIMIT ({args.patients} patients)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Startup benchmark: import time of app.py and latency of the first requests,
+with lazy model loading (default) and with PRELOAD_MODELS=1
+
+Usage: python benchmarks/startup.py [--runs N]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Builds a database with demo patients and a trained model in the working directory
+SETUP = '''
+import sys
+sys.path.insert(0, {backend!r})
+import app
+from models.database import get_db_connection, PATIENTS_WITH_VITALS
+from ml.risk_predictor import predictor
+
+client = app.app.test_client()
+for attempt in range(5):
+    client.post('/api/data/load-demo')
+    conn = get_db_connection()
+    patients = [dict(row) for row in conn.execute(PATIENTS_WITH_VITALS)]
+    conn.close()
+    try:
+        predictor.train_all_models(patients)
+        break
+    except ValueError:
+        continue  # Random demo data had a single class; regenerate
+'''
+
+# Times importing app.py, then the first request to each endpoint
+MEASURE = '''
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {backend!r})
+import app
+timings = {{'import': time.perf_counter() - start}}
+
+client = app.app.test_client()
+requests = [
+    ('health', 'get', '/api/health', None),
+    ('predict', 'post', '/api/predict/risk', {{'patientId': 'P00001'}}),
+    ('analyze', 'post', '/api/notes/analyze', {{'noteText': 'Fever and cough, started on azithromycin 500mg. ' + str(time.time())}})
+]
+for name, method, url, body in requests:
+    request_start = time.perf_counter()
+    response = getattr(client, method)(url, json=body)
+    assert response.status_code == 200, (url, response.status_code)
+    timings[name] = time.perf_counter() - request_start
+print(json.dumps(timings))
+'''
+
+COLUMNS = ['import', 'health', 'predict', 'analyze']
+
+def run_python(code, workdir, env=None):
+    result = subprocess.run(
+        [sys.executable, '-c', code], cwd=workdir, env=env,
+        capture_output=True, text=True, check=True
+    )
+    return result.stdout
+
+def prepare_workdir(workdir):
+    """Create a demo database and trained model in workdir"""
+    run_python(SETUP.format(backend=BACKEND_DIR), workdir)
+
+def measure(workdir, preload, runs):
+    env = dict(os.environ, PRELOAD_MODELS='1' if preload else '0')
+    samples = []
+    for _ in range(runs):
+        output = run_python(MEASURE.format(backend=BACKEND_DIR), workdir, env)
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    return {column: statistics.median(sample[column] for sample in samples) for column in COLUMNS}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=3, help='processes started per mode (median is reported)')
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as workdir:
+        print("⏳ Preparing demo database and trained model...")
+        prepare_workdir(workdir)
+        
+        print(f"\n{'mode':<10}" + ''.join(f"{column + ' (ms)':>16}" for column in COLUMNS) + f"{'ready (ms)':>16}")
+        for label, preload in [('lazy', False), ('preload', True)]:
+            timings = measure(workdir, preload, args.runs)
+            ready = timings['import'] + timings['health']
+            print(f"{label:<10}" + ''.join(f"{timings[column] * 1000:>16.1f}" for column in COLUMNS) + f"{ready * 1000:>16.1f}")
+        
+        print("\nready = import + first /api/health, i.e. how long until a new worker passes health checks")
+
+if __name__ == '__main__':
+    main()
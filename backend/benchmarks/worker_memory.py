@@ -0,0 +1,116 @@
+"""
+Worker memory benchmark: per-worker RSS / PSS / USS of gunicorn when every
+worker loads its own models, versus gunicorn.conf.py (models preloaded in
+the master and shared copy-on-write by forked workers)
+
+Usage: python benchmarks/worker_memory.py [--workers N] (Linux only: reads /proc)
+"""
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from startup import BACKEND_DIR, prepare_workdir
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def memory_kb(pid):
+    """(RSS, PSS, USS) of a process in kB, from /proc/<pid>/smaps_rollup"""
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1])
+    return fields['Rss'], fields['Pss'], fields['Private_Clean'] + fields['Private_Dirty']
+
+def child_pids(parent_pid):
+    children = []
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    # ppid is the 2nd field after the parenthesised command name
+                    if int(f.read().rsplit(')', 1)[1].split()[1]) == parent_pid:
+                        children.append(int(entry))
+            except (FileNotFoundError, ProcessLookupError):
+                continue
+    return children
+
+def request(port, path, body=None):
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(f'http://127.0.0.1:{port}{path}', data=data,
+                                 headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(req, timeout=60) as response:
+        return response.status
+
+def measure(workdir, workers, shared):
+    port = free_port()
+    command = [sys.executable, '-m', 'gunicorn', '--pythonpath', BACKEND_DIR,
+               '--workers', str(workers), '--bind', f'127.0.0.1:{port}']
+    env = dict(os.environ, PRELOAD_MODELS='1')
+    if shared:
+        command += ['-c', os.path.join(BACKEND_DIR, 'gunicorn.conf.py')]
+    else:
+        # Same models, loaded by each worker after it forks
+        command += ['app:app']
+    
+    server = subprocess.Popen(command, cwd=workdir, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.time() + 120
+        while True:
+            try:
+                request(port, '/api/health')
+                if len(child_pids(server.pid)) == workers:
+                    break
+            except OSError:
+                pass
+            if time.time() > deadline:
+                raise RuntimeError('gunicorn did not start')
+            time.sleep(0.2)
+        
+        # Let every worker finish booting, then exercise the model a little
+        time.sleep(5)
+        for _ in range(workers * 10):
+            request(port, '/api/predict/risk', {'patientId': 'P00001'})
+        
+        master = memory_kb(server.pid)
+        worker_memory = [memory_kb(pid) for pid in child_pids(server.pid)]
+    finally:
+        server.terminate()
+        server.wait()
+    
+    per_worker = [sum(values) / len(values) for values in zip(*worker_memory)]
+    total_pss = master[1] + sum(pss for _, pss, _ in worker_memory)
+    return per_worker, total_pss
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as workdir:
+        print("⏳ Preparing demo database and trained model...")
+        prepare_workdir(workdir)
+        
+        print(f"\n{args.workers} workers, average per worker (MB):")
+        print(f"{'mode':<22}{'RSS':>10}{'PSS':>10}{'USS':>10}{'total PSS':>12}")
+        for label, shared in [('load per worker', False), ('preload + fork', True)]:
+            (rss, pss, uss), total_pss = measure(workdir, args.workers, shared)
+            print(f"{label:<22}{rss / 1024:>10.1f}{pss / 1024:>10.1f}{uss / 1024:>10.1f}{total_pss / 1024:>12.1f}")
+        
+        print("\nRSS counts shared pages in every worker; PSS splits them between the processes")
+        print("sharing them and USS is memory private to the worker. total PSS includes the master.")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,23 @@
+"""
+Gunicorn settings: build the app and load the ML models once in the master,
+then fork workers that share that memory copy-on-write
+
+Usage: gunicorn -c gunicorn.conf.py
+"""
+
+import gc
+import os
+
+# create_app() in the master loads and warms up the models before forking
+os.environ.setdefault('PRELOAD_MODELS', '1')
+
+wsgi_app = 'app:app'
+preload_app = True
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+
+def when_ready(server):
+    # Runs in the master after the app is loaded and before workers fork.
+    # Freezing moves every object allocated so far out of the garbage
+    # collector's reach, so collections in workers do not write to (and
+    # un-share) the pages holding the preloaded models.
+    gc.freeze()
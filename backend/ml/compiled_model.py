@@ -0,0 +1,335 @@
+import copy
+
+import numpy as np
+
+# Rows pushed through the trees together; larger blocks fall out of cache
+BLOCK_ROWS = 256
+
+# Rows whose path contributions are summed in one sparse product (see explain_leaves)
+SPARSE_BLOCK_ROWS = 4096
+
+# float64 steps tried when snapping folded thresholds (see fold_scaler)
+MAX_SNAP_STEPS = 64
+
+class CompiledTreeEnsemble:
+    """A fitted tree model flattened into packed NumPy node arrays
+    
+    All trees share one set of node arrays (feature, threshold, left,
+    right, value); roots holds each tree's first node. Leaves point back
+    to themselves, so every row can be pushed down every tree at once for
+    max_depth steps with no per-row Python or sklearn dispatch.
+    
+    Rows are cast to float32 before the threshold comparisons, as sklearn
+    does, and per-tree values are accumulated in tree order, so results
+    match predict_proba(X)[:, 1] exactly. fold_scaler() moves a
+    StandardScaler into the thresholds. Node values are kept for internal
+    nodes too, which path_contributions() uses to attribute a prediction to
+    the features split on along each row's path.
+    """
+    
+    def __init__(self, trees, combine, init_raw=0.0, learning_rate=1.0):
+        # combine: 'average' for forests/single trees (values are P(class 1)),
+        # 'boosting' for gradient boosting (values are raw log-odds updates)
+        self.combine = combine
+        # sklearn trees compare float32 features; folded ones take raw float64 features
+        self.input_dtype = np.float32
+        self.init_raw = init_raw
+        self.learning_rate = learning_rate
+        
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset = 0
+        for tree, value in trees:
+            is_leaf = tree.children_left < 0
+            node_ids = np.arange(tree.node_count) + offset
+            roots.append(offset)
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(np.where(is_leaf, 0.0, tree.threshold))
+            lefts.append(np.where(is_leaf, node_ids, tree.children_left + offset))
+            rights.append(np.where(is_leaf, node_ids, tree.children_right + offset))
+            values.append(value)
+            offset += tree.node_count
+        
+        self.feature = np.concatenate(features).astype(np.intp)
+        self.threshold = np.concatenate(thresholds).astype(np.float64)
+        self.left = np.concatenate(lefts).astype(np.intp)
+        self.right = np.concatenate(rights).astype(np.intp)
+        # children[2 * node] is the left child, children[2 * node + 1] the right one
+        self.children = np.column_stack([self.left, self.right]).ravel()
+        self.value = np.concatenate(values).astype(np.float64)
+        self.roots = np.array(roots, dtype=np.intp)
+        self.max_depth = max(tree.max_depth for tree, _ in trees)
+    
+    def fold_scaler(self, mean, scale):
+        """Copy of this ensemble that takes unscaled float64 features
+        
+        (x - mean) / scale <= t  is  x <= t * scale + mean  for scale > 0
+        (always true for StandardScaler), so the scaler moves into the
+        split thresholds. sklearn compares float32((x - mean) / scale), so
+        each threshold becomes the largest float64 x for which that value
+        still goes left: exact even when a threshold sits on a training value.
+        """
+        mean = mean[self.feature]
+        scale = scale[self.feature]
+        
+        def goes_left(x):
+            return ((x - mean) / scale).astype(np.float32) <= self.threshold
+        
+        # Scaled values below the midpoint of the float32s around t round to <= t
+        low = self.threshold.astype(np.float32)
+        low = np.where(low > self.threshold, np.nextafter(low, np.float32(-np.inf)), low)
+        high = np.nextafter(low, np.float32(np.inf))
+        raw = (low.astype(np.float64) + high.astype(np.float64)) / 2 * scale + mean
+        
+        # Then fix the last float64 rounding of that boundary
+        for _ in range(MAX_SNAP_STEPS):
+            too_high = ~goes_left(raw)
+            if not too_high.any():
+                break
+            raw = np.where(too_high, np.nextafter(raw, -np.inf), raw)
+        for _ in range(MAX_SNAP_STEPS):
+            higher = np.nextafter(raw, np.inf)
+            can_raise = goes_left(higher)
+            if not can_raise.any():
+                break
+            raw = np.where(can_raise, higher, raw)
+        
+        folded = copy.copy(self)
+        folded.threshold = raw
+        folded.input_dtype = np.float64
+        return folded
+    
+    def leaf_nodes(self, X):
+        """(n_trees, n_rows) index of the leaf each row reaches in each tree"""
+        X = np.ascontiguousarray(X, dtype=self.input_dtype)
+        n_rows, n_features = X.shape
+        X_flat = X.ravel()
+        row_offsets = np.arange(n_rows, dtype=np.intp) * n_features
+        
+        nodes = np.repeat(self.roots[:, None], n_rows, axis=1)
+        for _ in range(self.max_depth):
+            go_right = X_flat[self.feature[nodes] + row_offsets] > self.threshold[nodes]
+            nodes = self.children[2 * nodes + go_right]
+        return nodes
+    
+    def leaf_values(self, X):
+        """(n_trees, n_rows) value of the leaf each row reaches in each tree"""
+        return self.value[self.leaf_nodes(X)]
+    
+    def path_contributions(self, n_features):
+        """(n_nodes, n_features) credit each feature has collected on the way from the root to a node
+        
+        Saabas path attribution: every split credits its feature with the
+        change in node value from the node to the child taken. Built one tree
+        level at a time and kept, so export_fused_model can store it with the
+        fused model; older exports build it on first use.
+        """
+        table = self.__dict__.get('path_table')
+        if table is not None and table.shape[1] == n_features:
+            return table
+        
+        table = np.zeros((len(self.value), n_features))
+        is_split = self.left != np.arange(len(self.value))
+        nodes = self.roots
+        for _ in range(self.max_depth):
+            nodes = nodes[is_split[nodes]]
+            children = (self.left[nodes], self.right[nodes])
+            for child in children:
+                table[child] = table[nodes]
+                table[child, self.feature[nodes]] += self.value[child] - self.value[nodes]
+            nodes = np.concatenate(children)
+        
+        self.path_table = table
+        return table
+    
+    def contributions(self, X):
+        """(n_rows, n_features) contribution of each feature to each row's prediction
+        
+        The path_contributions() of the leaves each row reaches, combined
+        like the predictions, so a row's contributions sum to its prediction
+        minus baseline(): in probability for forests, log-odds for boosting.
+        """
+        return self.explain(X)[1]
+    
+    def explain(self, X):
+        """(predict_proba(X), contributions(X)) from a single pass down the trees"""
+        if len(X) > BLOCK_ROWS:
+            blocks = [self.explain(X[start:start + BLOCK_ROWS]) for start in range(0, len(X), BLOCK_ROWS)]
+            return tuple(np.concatenate(parts) for parts in zip(*blocks))
+        return self.explain_leaves(self.leaf_nodes(X), np.shape(X)[1])
+    
+    def explain_leaves(self, nodes, n_features):
+        """explain() for rows whose (n_trees, n_rows) leaves are already known
+        
+        Up to BLOCK_ROWS rows gather their leaves' path contributions and add
+        them up; larger blocks multiply a sparse (rows x nodes) leaf
+        indicator by the path_contributions() table instead, which skips the
+        (n_trees, n_rows, n_features) gather and is about twice as fast.
+        """
+        n_rows = nodes.shape[1]
+        if n_rows > SPARSE_BLOCK_ROWS:
+            blocks = [
+                self.explain_leaves(nodes[:, start:start + SPARSE_BLOCK_ROWS], n_features)
+                for start in range(0, n_rows, SPARSE_BLOCK_ROWS)
+            ]
+            return tuple(np.concatenate(parts) for parts in zip(*blocks))
+        
+        table = self.path_contributions(n_features)
+        if n_rows > BLOCK_ROWS:
+            from scipy.sparse import csr_matrix
+            
+            leaves = csr_matrix(
+                (np.ones(nodes.size), nodes.T.ravel(), np.arange(0, nodes.size + 1, len(self.roots))),
+                shape=(n_rows, len(table))
+            )
+            contributions = leaves @ table
+        else:
+            contributions = np.add.reduce(table[nodes], axis=0)
+        if self.combine == 'average':
+            contributions /= len(self.roots)
+        else:
+            contributions *= self.learning_rate
+        return self._probabilities(self.value[nodes]), contributions
+    
+    def nodes_from_apply(self, leaves):
+        """(n_trees, n_rows) node indices from the compiled model's sklearn apply() output"""
+        # Gradient boosting's apply() returns the leaf indices as floats
+        return (np.reshape(leaves, (len(leaves), -1)).astype(np.intp) + self.roots).T
+    
+    def baseline(self):
+        """Prediction before any split (the roots' values), in the units of contributions()"""
+        if self.combine == 'average':
+            return float(self.value[self.roots].mean())
+        return self.init_raw + self.learning_rate * float(self.value[self.roots].sum())
+    
+    def predict_proba(self, X):
+        """P(class 1) for each row of X, i.e. the model's predict_proba(X)[:, 1]"""
+        if len(X) > BLOCK_ROWS:
+            return np.concatenate([
+                self.predict_proba(X[start:start + BLOCK_ROWS]) for start in range(0, len(X), BLOCK_ROWS)
+            ])
+        return self._probabilities(self.leaf_values(X))
+    
+    def _probabilities(self, values):
+        """Combine (n_trees, n_rows) leaf values into P(class 1) per row"""
+        # Reducing over axis 0 adds the trees one after another, like sklearn
+        if self.combine == 'average':
+            return np.add.reduce(values, axis=0) / len(self.roots)
+        
+        from scipy.special import expit
+        
+        updates = np.empty((len(values) + 1, values.shape[1]))
+        updates[0] = self.init_raw
+        np.multiply(values, self.learning_rate, out=updates[1:])
+        return expit(np.add.reduce(updates, axis=0))
+
+class CompiledLinearModel:
+    """Binary logistic regression as one weight vector and intercept
+    
+    center is the point contributions() measure features from: zero for
+    scaled input, the scaler's mean once it is folded in.
+    """
+    
+    # Exports made before contributions() existed measure from zero
+    center = 0.0
+    
+    def __init__(self, weights, intercept, center=None):
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.intercept = float(intercept)
+        self.center = np.zeros_like(self.weights) if center is None else np.asarray(center, dtype=np.float64)
+    
+    def fold_scaler(self, mean, scale):
+        """Copy of this model that takes unscaled features
+        
+        w . (x - mean) / scale + b  is  (w / scale) . x + (b - w . mean / scale)
+        """
+        weights = self.weights / scale
+        return CompiledLinearModel(weights, self.intercept - weights @ mean, self.center * scale + mean)
+    
+    def contributions(self, X):
+        """(n_rows, n_features) log-odds contribution of each feature: coefficient x scaled value"""
+        return (np.asarray(X, dtype=np.float64) - self.center) * self.weights
+    
+    def explain(self, X):
+        """(predict_proba(X), contributions(X))"""
+        return self.predict_proba(X), self.contributions(X)
+    
+    def baseline(self):
+        """Log-odds at the center, so contributions() sum to the log-odds minus this"""
+        return self.intercept + float(self.weights @ self.center)
+    
+    def predict_proba(self, X):
+        """P(class 1) for each row of X, i.e. the model's predict_proba(X)[:, 1]"""
+        from scipy.special import expit
+        
+        return expit(np.asarray(X, dtype=np.float64) @ self.weights + self.intercept)
+
+def _class_one_probability(tree):
+    """Per-node P(class 1) of a classification tree, normalized as in predict_proba"""
+    value = tree.value[:, 0, :]
+    normalizer = value.sum(axis=1)
+    normalizer[normalizer == 0.0] = 1.0
+    return value[:, 1] / normalizer
+
+def compile_model(model):
+    """Compile a fitted binary classifier, or return None if it can't be compiled
+    
+    Supports DecisionTreeClassifier, RandomForestClassifier,
+    GradientBoostingClassifier with the default (prior) init and binary
+    LogisticRegression; anything else keeps using the sklearn model.
+    """
+    from sklearn.dummy import DummyClassifier
+    from sklearn.ensemble import GradientBoostingClassifier, RandomForestClassifier
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.tree import DecisionTreeClassifier
+    
+    if list(getattr(model, 'classes_', [])) != [0, 1]:
+        return None
+    
+    if isinstance(model, LogisticRegression) and model.coef_.shape[0] == 1:
+        return CompiledLinearModel(model.coef_[0], model.intercept_[0])
+    
+    if isinstance(model, DecisionTreeClassifier):
+        return CompiledTreeEnsemble([(model.tree_, _class_one_probability(model.tree_))], 'average')
+    
+    if isinstance(model, RandomForestClassifier):
+        trees = [(estimator.tree_, _class_one_probability(estimator.tree_)) for estimator in model.estimators_]
+        return CompiledTreeEnsemble(trees, 'average')
+    
+    if isinstance(model, GradientBoostingClassifier) and model.estimators_.shape[1] == 1:
+        if model.init_ == 'zero':
+            init_raw = 0.0
+        elif isinstance(model.init_, DummyClassifier):
+            from scipy.special import logit
+            
+            # Same log-odds of the prior as sklearn's binomial loss
+            eps = np.finfo(np.float64).eps
+            prior = np.clip(model.init_.predict_proba(np.zeros((1, model.n_features_in_)))[0, 1], eps, 1 - eps)
+            init_raw = float(logit(prior))
+        else:
+            return None
+        
+        trees = [(estimator.tree_, estimator.tree_.value[:, 0, 0]) for estimator in model.estimators_[:, 0]]
+        return CompiledTreeEnsemble(trees, 'boosting', init_raw, model.learning_rate)
+    
+    return None
+
+def export_fused_model(model, scaler):
+    """Scaler-free predictor for model: compile_model with the scaler folded in
+    
+    The result takes the raw feature matrix and matches
+    model.predict_proba(scaler.transform(X))[:, 1] (exactly for tree
+    models, to float rounding for logistic regression); returns None if
+    the model can't be compiled.
+    """
+    compiled = compile_model(model)
+    if compiled is None:
+        return None
+    
+    n_features = model.n_features_in_
+    mean = scaler.mean_ if getattr(scaler, 'mean_', None) is not None else np.zeros(n_features)
+    scale = scaler.scale_ if getattr(scaler, 'scale_', None) is not None else np.ones(n_features)
+    fused = compiled.fold_scaler(np.asarray(mean, dtype=np.float64), np.asarray(scale, dtype=np.float64))
+    if isinstance(fused, CompiledTreeEnsemble):
+        # Stored with the export so workers memory-map it instead of rebuilding it
+        fused.path_contributions(n_features)
+    return fused
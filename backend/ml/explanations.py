@@ -0,0 +1,76 @@
+import numpy as np
+
+# Risk factors reported per prediction
+TOP_FACTORS = 3
+
+NO_FACTORS = "No significant risk factors identified"
+
+# How a feature is described as a risk factor, formatted with the patient's
+# value of it (its diagnosis for diagnosis_risk)
+FACTOR_TEMPLATES = {
+    'age': "Age ({:.0f} years)",
+    'length_of_stay': "Length of stay ({:.0f} days)",
+    'previous_admissions': "Previous admissions ({:.0f})",
+    'comorbidities': "Comorbidities ({:.0f})",
+    'heart_rate': "Heart rate ({:.0f} bpm)",
+    'bp_systolic': "Systolic blood pressure ({:.0f} mmHg)",
+    'bp_diastolic': "Diastolic blood pressure ({:.0f} mmHg)",
+    'temperature': "Temperature ({:.1f}°C)",
+    'oxygen_saturation': "Oxygen saturation ({:.0f}%)",
+    'diagnosis_risk': "Diagnosis: {}"
+}
+
+def top_contributions(contributions, k=TOP_FACTORS):
+    """(order, counts): column indices of each row's k largest contributions, largest first,
+    and how many of them are positive
+    
+    Features that lower the risk (or don't move it) are not risk factors, so
+    only the first counts[row] entries of order[row] are reported.
+    """
+    order = np.argsort(-contributions, axis=1, kind='stable')[:, :k]
+    # Sorted largest first, so the positive ones are a prefix of each row
+    counts = (np.take_along_axis(contributions, order, axis=1) > 0).sum(axis=1)
+    return order, counts
+
+def top_risk_factors(contributions, X, diagnoses, feature_names, k=TOP_FACTORS):
+    """Top risk factors of every row of the raw feature matrix X according to what the model learned
+    
+    contributions is the (n_rows, n_features) output of a compiled model's
+    contributions() or explain() (ml.compiled_model): tree path
+    contributions for forests and boosting, coefficient x scaled value for
+    logistic regression. Each distinct value of a feature is worded once
+    and every (row, rank) gets a code into that table of texts, so rows
+    are only touched as Python objects when the lists are built. Returns
+    one list of factor strings per row.
+    """
+    order, counts = top_contributions(contributions, k)
+    n_rows, k = order.shape
+    diagnoses = np.asarray(diagnoses, dtype=str)
+    
+    # Positions in order, grouped by the feature they name
+    flat = order.ravel()
+    positions = np.argsort(flat, kind='stable')
+    ends = np.cumsum(np.bincount(flat, minlength=len(feature_names)))
+    
+    codes = np.empty(flat.shape, dtype=np.intp)
+    texts = []
+    for column, name in enumerate(feature_names):
+        picked = positions[ends[column - 1] if column else 0:ends[column]]
+        if not len(picked):
+            continue
+        rows = picked // k
+        if name == 'diagnosis_risk':
+            # Few distinct diagnoses; a dict is much faster than sorting strings
+            index = {}
+            inverse = [index.setdefault(value, len(index)) for value in diagnoses[rows].tolist()]
+            unique = list(index)
+        else:
+            unique, inverse = np.unique(X[rows, column], return_inverse=True)
+            unique = unique.tolist()
+        codes[picked] = np.reshape(inverse, -1) + len(texts)
+        texts.extend(FACTOR_TEMPLATES[name].format(value) for value in unique)
+    
+    factors = np.array(texts, dtype=object)[codes.reshape(n_rows, k)].tolist()
+    for row in np.flatnonzero(counts < k).tolist():
+        factors[row] = factors[row][:counts[row]] or [NO_FACTORS]
+    return factors
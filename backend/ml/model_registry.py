@@ -0,0 +1,149 @@
+import json
+import os
+import shutil
+import threading
+from datetime import datetime
+
+# Registry location, relative to the working directory like the database
+MODEL_REGISTRY_DIR = os.environ.get('MODEL_REGISTRY_DIR', 'model_registry')
+
+# Model artifacts are loaded with joblib's mmap_mode so their NumPy arrays are
+# file-backed pages shared by every worker; set MODEL_MMAP_MODE= to disable
+MODEL_MMAP_MODE = os.environ.get('MODEL_MMAP_MODE', 'r') or None
+
+MODEL_FILE = 'model.pkl'
+SCALER_FILE = 'scaler.pkl'
+CANDIDATES_FILE = 'all_models.pkl'
+FUSED_FILE = 'fused.pkl'
+MANIFEST_FILE = 'manifest.json'
+
+class ModelRegistry:
+    """Versioned model artifacts with an atomically switched active version
+    
+    Layout:
+        <root>/versions/<version>/model.pkl, scaler.pkl, all_models.pkl, fused.pkl, manifest.json
+        <root>/ACTIVE   {"version": ..., "history": [previously active versions]}
+    
+    Version directories are written under a temporary name and renamed into
+    place, and ACTIVE is replaced with os.replace, so readers in other
+    workers never see a half-written version or pointer.
+    """
+    
+    def __init__(self, root=MODEL_REGISTRY_DIR):
+        self.root = root
+        self.versions_dir = os.path.join(root, 'versions')
+        self.active_path = os.path.join(root, 'ACTIVE')
+        self._lock = threading.Lock()
+    
+    def _version_dir(self, version):
+        return os.path.join(self.versions_dir, version)
+    
+    def _write_json(self, path, data):
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, path)
+    
+    def _read_pointer(self):
+        try:
+            with open(self.active_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'version': None, 'history': []}
+    
+    def register(self, model, scaler, candidates, manifest, fused=None):
+        """Store a trained model as a new (inactive) version and return the version
+        
+        manifest holds the metadata to keep with it (active model name,
+        feature names, metrics, training size); version and createdAt are
+        added here. fused maps candidate names to their exported scaler-free
+        predictors (see ml.compiled_model.export_fused_model).
+        """
+        import joblib
+        
+        created_at = datetime.now()
+        version = created_at.strftime('%Y%m%d%H%M%S%f')
+        os.makedirs(self.versions_dir, exist_ok=True)
+        
+        tmp_dir = os.path.join(self.versions_dir, f'.{version}.{os.getpid()}.tmp')
+        os.makedirs(tmp_dir)
+        try:
+            # Uncompressed, so the arrays can be memory-mapped on load
+            joblib.dump(model, os.path.join(tmp_dir, MODEL_FILE))
+            joblib.dump(scaler, os.path.join(tmp_dir, SCALER_FILE))
+            joblib.dump(candidates, os.path.join(tmp_dir, CANDIDATES_FILE))
+            if fused is not None:
+                joblib.dump(fused, os.path.join(tmp_dir, FUSED_FILE))
+            manifest = {'version': version, 'createdAt': created_at.isoformat(), **manifest}
+            self._write_json(os.path.join(tmp_dir, MANIFEST_FILE), manifest)
+            os.rename(tmp_dir, self._version_dir(version))
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        
+        return version
+    
+    def active_version(self):
+        """Version currently promoted, or None if nothing has been promoted yet"""
+        return self._read_pointer()['version']
+    
+    def promote(self, version):
+        """Make version the active model; the previous one is kept for rollback"""
+        if not os.path.exists(os.path.join(self._version_dir(version), MANIFEST_FILE)):
+            raise ValueError(f'Unknown model version: {version}')
+        
+        with self._lock:
+            pointer = self._read_pointer()
+            if pointer['version'] == version:
+                return version
+            history = pointer['history'] + ([pointer['version']] if pointer['version'] else [])
+            self._write_json(self.active_path, {'version': version, 'history': history})
+        return version
+    
+    def rollback(self):
+        """Re-activate the version that was active before the current one"""
+        with self._lock:
+            pointer = self._read_pointer()
+            if not pointer['history']:
+                raise ValueError('No previous model version to roll back to')
+            
+            history = pointer['history'][:-1]
+            version = pointer['history'][-1]
+            self._write_json(self.active_path, {'version': version, 'history': history})
+        return version
+    
+    def manifest(self, version):
+        with open(os.path.join(self._version_dir(version), MANIFEST_FILE)) as f:
+            return json.load(f)
+    
+    def list_versions(self):
+        """Manifests of every registered version, newest first"""
+        if not os.path.isdir(self.versions_dir):
+            return []
+        
+        versions = sorted(
+            (name for name in os.listdir(self.versions_dir) if not name.startswith('.')),
+            reverse=True
+        )
+        return [self.manifest(version) for version in versions]
+    
+    def load(self, version):
+        """Return (model, scaler, manifest) for a registered version"""
+        import joblib
+        
+        version_dir = self._version_dir(version)
+        model = joblib.load(os.path.join(version_dir, MODEL_FILE), mmap_mode=MODEL_MMAP_MODE)
+        scaler = joblib.load(os.path.join(version_dir, SCALER_FILE), mmap_mode=MODEL_MMAP_MODE)
+        return model, scaler, self.manifest(version)
+    
+    def load_fused(self, version):
+        """Exported fused predictors of a version by candidate name, or None for older versions"""
+        import joblib
+        
+        fused_path = os.path.join(self._version_dir(version), FUSED_FILE)
+        if not os.path.exists(fused_path):
+            return None
+        return joblib.load(fused_path, mmap_mode=MODEL_MMAP_MODE)
+
+# Global registry instance
+registry = ModelRegistry()
@@ -0,0 +1,179 @@
+import importlib
+import math
+import os
+import time
+from collections import defaultdict, namedtuple
+
+import numpy as np
+
+# scikit-learn and joblib are imported on first use, like in ml.risk_predictor
+
+# Folds each configuration is cross-validated on
+CV_FOLDS = int(os.environ.get('CV_FOLDS', 5))
+
+# Successive halving: each rung keeps the best 1/HALVING_FACTOR of the
+# configurations and gives them HALVING_FACTOR times more training rows
+HALVING_FACTOR = 3
+
+# Training rows per configuration in the first rung; smaller training sets
+# are not searched (see small_data_search)
+HALVING_MIN_ROWS = 500
+
+# Folds used when the training set is smaller than HALVING_MIN_ROWS
+SMALL_DATA_CV_FOLDS = 3
+
+# best: index of the chosen config; scores: config index -> (rung, mean CV
+# accuracy) at the last rung it ran in; fit_seconds: per config index
+SearchResult = namedtuple('SearchResult', ['best', 'scores', 'fit_seconds', 'rungs', 'folds', 'stopped_early'])
+
+def build_estimator(estimator_path, params):
+    """Instantiate an estimator from its dotted class path"""
+    module_name, class_name = estimator_path.rsplit('.', 1)
+    return getattr(importlib.import_module(module_name), class_name)(**params)
+
+def expand_search_space(params, search_space):
+    """Every combination of the search_space values applied on top of params"""
+    from sklearn.model_selection import ParameterGrid
+    
+    return [{**params, **combination} for combination in ParameterGrid(search_space or {})]
+
+def small_data_search(n_rows):
+    """Whether n_rows training rows are too few to search hyperparameters on
+    
+    Below HALVING_MIN_ROWS every rung would train on all rows, so the search
+    fits every combination on every fold and CV accuracy is too noisy to
+    tell them apart; callers score each candidate's defaults on
+    SMALL_DATA_CV_FOLDS folds instead.
+    """
+    return n_rows < HALVING_MIN_ROWS
+
+def _stratified_order(y, random_state):
+    """Random permutation of the rows in which every prefix keeps y's class proportions
+    
+    Each class's rows are shuffled and spread evenly over the order, and
+    every class's first row comes first, so any prefix at least as long as
+    the number of classes contains all of them.
+    """
+    rng = np.random.RandomState(random_state)
+    order = rng.permutation(len(y))
+    position = np.empty(len(y))
+    for label in np.unique(y):
+        rows = order[y[order] == label]
+        position[rows] = np.arange(len(rows)) / len(rows)
+    # Rows at the same position go in the shuffled order
+    return order[np.argsort(position[order], kind='stable')]
+
+def _cv_splits(y, cv_folds, random_state):
+    """Stratified folds; a class with a single row is kept in every training fold"""
+    from sklearn.model_selection import KFold, StratifiedKFold
+    
+    class_counts = np.bincount(y)
+    n_splits = min(cv_folds, class_counts[class_counts > 0].min())
+    if n_splits >= 2:
+        folds = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=random_state)
+        return list(folds.split(np.zeros(len(y)), y))
+    
+    single = np.flatnonzero(np.isin(y, np.flatnonzero(class_counts == 1)))
+    folds = KFold(n_splits=min(cv_folds, len(y)), shuffle=True, random_state=random_state)
+    splits = [
+        (np.union1d(train_index, single), np.setdiff1d(test_index, single))
+        for train_index, test_index in folds.split(np.zeros(len(y)))
+    ]
+    return [(train_index, test_index) for train_index, test_index in splits if len(test_index)]
+
+def _score_fold(index, estimator_path, params, X, y, train_index, test_index, deadline=None):
+    """Fit one configuration on one fold and score it; runs in a training worker
+    
+    Past deadline (a time.time() value) the fit is skipped and the accuracy is None.
+    """
+    if deadline is not None and time.time() >= deadline:
+        return index, None, 0.0
+    
+    started = time.perf_counter()
+    model = build_estimator(estimator_path, params)
+    model.fit(X[train_index], y[train_index])
+    accuracy = model.score(X[test_index], y[test_index])
+    return index, accuracy, time.perf_counter() - started
+
+def successive_halving(configs, X, y, time_budget=None, n_jobs=1, cv_folds=CV_FOLDS,
+                       factor=HALVING_FACTOR, min_rows=HALVING_MIN_ROWS, random_state=42):
+    """Pick the best of configs, [(estimator class path, params)], by k-fold CV accuracy
+    
+    Every surviving configuration is cross-validated on a subsample of the
+    rows; the best 1/factor move on to a subsample factor times larger,
+    until one is left or all rows are used. The fold fits of a rung run
+    in parallel on n_jobs processes. With a time_budget (seconds) the
+    search stops before a rung that is predicted to overrun it, and every
+    fit after the first rung checks the deadline before it starts; a rung
+    cut short is discarded and the best configuration of the last finished
+    rung is kept. The first rung always runs, so it can overrun the budget.
+    Rung subsamples are stratified by class, and folds whose training rows
+    are all one class are skipped (ValueError if y has a single class).
+    """
+    from joblib import Parallel, delayed
+    
+    started = time.perf_counter()
+    deadline = time.time() + time_budget if time_budget is not None else None
+    order = _stratified_order(y, random_state)
+    n_rungs = max(1, math.ceil(math.log(len(configs), factor)))
+    
+    survivors = list(range(len(configs)))
+    scores = {}
+    fit_seconds = [0.0] * len(configs)
+    rungs = []
+    n_folds = 0
+    stopped_early = False
+    
+    for rung in range(n_rungs):
+        n_rows = min(len(y), max(min_rows, len(y) // factor ** (n_rungs - 1 - rung)))
+        
+        if time_budget is not None and rungs:
+            previous = rungs[-1]
+            predicted = previous['seconds'] * (len(survivors) * n_rows) / (previous['configs'] * previous['rows'])
+            if time.perf_counter() - started + predicted > time_budget:
+                stopped_early = True
+                break
+        
+        rung_started = time.perf_counter()
+        rows = order[:n_rows]
+        X_rung, y_rung = X[rows], y[rows]
+        # A fold that trains on one class cannot be fit by every candidate, so it is not scored
+        splits = [
+            (train_index, test_index) for train_index, test_index in _cv_splits(y_rung, cv_folds, random_state)
+            if len(np.unique(y_rung[train_index])) > 1
+        ]
+        if not splits:
+            raise ValueError('Every cross-validation fold trains on a single class')
+        n_folds = len(splits)
+        
+        fold_results = Parallel(n_jobs=n_jobs)(
+            delayed(_score_fold)(
+                index, *configs[index], X_rung, y_rung, train_index, test_index, deadline if rungs else None
+            )
+            for index in survivors
+            for train_index, test_index in splits
+        )
+        
+        fold_scores = defaultdict(list)
+        for index, accuracy, seconds in fold_results:
+            fold_scores[index].append(accuracy)
+            fit_seconds[index] += seconds
+        if any(accuracy is None for _, accuracy, _ in fold_results):
+            stopped_early = True
+            break
+        for index in survivors:
+            scores[index] = (rung, float(np.mean(fold_scores[index])))
+        
+        rungs.append({
+            'rows': n_rows,
+            'configs': len(survivors),
+            'seconds': round(time.perf_counter() - rung_started, 3)
+        })
+        
+        # Stable sort, so ties keep the configuration order
+        survivors = sorted(survivors, key=lambda index: scores[index][1], reverse=True)
+        survivors = survivors[:max(1, math.ceil(len(survivors) / factor))]
+        if len(survivors) == 1 or n_rows == len(y):
+            break
+    
+    return SearchResult(survivors[0], scores, fit_seconds, rungs, n_folds, stopped_early)
@@ -1,13 +1,58 @@
-import spacy
+import hashlib
+import importlib.metadata
+import json
+import os
 import re
+import threading
+
+# spaCy is imported, and this model loaded, on first use rather than at import time
+SPACY_MODEL = 'en_core_web_sm'
+
+# Notes per spaCy nlp.pipe batch, and worker processes, for batch analysis
+NLP_BATCH_SIZE = int(os.environ.get('NLP_BATCH_SIZE', 64))
+NLP_N_PROCESS = int(os.environ.get('NLP_N_PROCESS', 1))
+
+# Bump when extract_entities / generate_summary change what they return, so
+# stored analyses (see ml.note_entities) are recomputed
+ANALYSIS_REVISION = 1
+
+# Pipeline components extract_entities never reads (it only uses doc.ents)
+UNUSED_PIPES = ['tagger', 'parser', 'attribute_ruler', 'lemmatizer']
+
+def _keyword_trie_regex(keywords):
+    """Regex matching the longest of keywords at a position, factored as a trie
+    
+    Common prefixes are shared (e.g. "c(?:hest pain|o(?:pd|ugh)|...)"), so
+    the engine rejects most positions on their first character instead of
+    trying every keyword in turn.
+    """
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[''] = True
+    
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        # Greedy optional: prefer extending to a longer keyword
+        return f'(?:{body})?' if '' in node else body
+    
+    return build(trie)
 
 class NLPAnalyzer:
     def __init__(self):
+        self._nlp = None
+        self._loaded = False
+        self._load_lock = threading.Lock()
+        self._versions = {}
         try:
-            self.nlp = spacy.load("en_core_web_sm")
-        except:
-            print("⚠️  spaCy model not found. Run: python -m spacy download en_core_web_sm")
-            self.nlp = None
+            self._installed_model = f"{SPACY_MODEL}-{importlib.metadata.version(SPACY_MODEL)}"
+        except importlib.metadata.PackageNotFoundError:
+            self._installed_model = None
         
         # Medical entity patterns
         self.symptom_patterns = [
@@ -32,69 +77,154 @@ class NLPAnalyzer:
             'myocardial infarction', 'stroke', 'fracture', 'infection', 'copd',
             'kidney disease', 'ketoacidosis'
         ]
+        
+        # Keyword lists per output category and their confidence, compiled into one matcher
+        self.entity_categories = {
+            'symptoms': (self.symptom_patterns, 0.9),
+            'medications': (self.medication_patterns, 0.95),
+            'procedures': (self.procedure_patterns, 0.85),
+            'diagnoses': (self.diagnosis_patterns, 0.9)
+        }
+        self.dosage_pattern = re.compile(r'(\d+\s*(?:mg|g|ml|mcg))')
+        self._compile_entity_matcher()
+    
+    def ensure_loaded(self):
+        """Load the spaCy model now if it has not been loaded yet
+        
+        Called on first use of nlp; call it directly to pay the loading cost
+        up front (see preload_models).
+        """
+        if self._loaded:
+            return
+        with self._load_lock:
+            if not self._loaded:
+                try:
+                    import spacy
+                    self._nlp = spacy.load(SPACY_MODEL)
+                except:
+                    print(f"⚠️  spaCy model not found. Run: python -m spacy download {SPACY_MODEL}")
+                    self._nlp = None
+                self._loaded = True
     
-    def extract_entities(self, text):
-        """Extract medical entities from clinical note"""
+    @property
+    def nlp(self):
+        self.ensure_loaded()
+        return self._nlp
+    
+    @nlp.setter
+    def nlp(self, value):
+        self._nlp = value
+        self._loaded = True
+    
+    @property
+    def version(self):
+        """Identify the rules and spaCy model that produce analyses
+        
+        Before the model is loaded this uses the installed model package, so
+        stored analyses can be looked up without loading spaCy.
+        """
+        if self._loaded:
+            spacy_model = f"{SPACY_MODEL}-{self._nlp.meta['version']}" if self._nlp else None
+        else:
+            spacy_model = self._installed_model
+        
+        if spacy_model not in self._versions:
+            rules = json.dumps([self.symptom_patterns, self.medication_patterns, self.procedure_patterns,
+                                self.diagnosis_patterns, spacy_model])
+            self._versions[spacy_model] = f"{ANALYSIS_REVISION}-{hashlib.sha1(rules.encode()).hexdigest()[:12]}"
+        return self._versions[spacy_model]
+    
+    def _compile_entity_matcher(self):
+        """Build the single-scan keyword matcher used by extract_entities
+        
+        A match is always the longest keyword starting at that position;
+        shorter keywords that are prefixes of it start there too, and are
+        looked up in keyword_prefixes.
+        """
+        keywords = {keyword for patterns, _ in self.entity_categories.values() for keyword in patterns}
+        pattern = _keyword_trie_regex(keywords)
+        self.entity_regex = re.compile(pattern)
+        self.entity_regex_ignorecase = re.compile(pattern, re.IGNORECASE)
+        self.keyword_prefixes = {
+            keyword: sorted((other for other in keywords if keyword.startswith(other)), key=len)
+            for keyword in keywords
+        }
+    
+    def _find_keywords(self, text):
+        """Map each keyword to its non-overlapping (start, end) spans in text
+        
+        Same spans as running a case-insensitive re.finditer per keyword, found
+        in one pass: the scan resumes one character after every match start
+        so overlapping keywords (e.g. "chest pain" and "pain") are all seen.
+        """
         text_lower = text.lower()
+        if len(text_lower) == len(text):
+            scanned, search = text_lower, self.entity_regex.search
+        else:
+            # lower() changed the length (e.g. "İ"), so positions would not line up
+            scanned, search = text, self.entity_regex_ignorecase.search
         
-        # Extract symptoms
-        symptoms = []
-        for symptom in self.symptom_patterns:
-            if symptom in text_lower:
-                # Find actual occurrence in original text
-                pattern = re.compile(re.escape(symptom), re.IGNORECASE)
-                matches = pattern.finditer(text)
-                for match in matches:
-                    symptoms.append({
-                        'text': match.group(),
-                        'confidence': 0.9
-                    })
+        spans = {}
+        match = search(scanned)
+        while match:
+            start = match.start()
+            for keyword in self._keyword_prefixes_of(match.group()):
+                keyword_spans = spans.setdefault(keyword, [])
+                if not keyword_spans or keyword_spans[-1][1] <= start:
+                    keyword_spans.append((start, start + len(keyword)))
+            match = search(scanned, start + 1)
+        return spans
+    
+    def _keyword_prefixes_of(self, matched):
+        prefixes = self.keyword_prefixes.get(matched) or self.keyword_prefixes.get(matched.lower())
+        if prefixes is None:
+            keyword = next(
+                keyword for keyword in self.keyword_prefixes
+                if re.fullmatch(re.escape(keyword), matched, re.IGNORECASE)
+            )
+            prefixes = self.keyword_prefixes[keyword]
+        return prefixes
+    
+    def _spacy_docs(self, texts, batch_size=NLP_BATCH_SIZE, n_process=NLP_N_PROCESS):
+        """Run texts through spaCy with only the components NER needs"""
+        disable = [name for name in UNUSED_PIPES if name in self.nlp.pipe_names]
+        return self.nlp.pipe(texts, batch_size=batch_size, n_process=n_process, disable=disable)
+    
+    def extract_entities(self, text, doc=None):
+        """Extract medical entities from clinical note
         
-        # Extract medications
-        medications = []
-        for med in self.medication_patterns:
-            if med in text_lower:
-                pattern = re.compile(re.escape(med), re.IGNORECASE)
-                matches = pattern.finditer(text)
-                for match in matches:
-                    # Extract dosage if present
-                    dosage_pattern = r'(\d+\s*(?:mg|g|ml|mcg))'
-                    dosage_match = re.search(dosage_pattern, text[max(0, match.start()-10):match.end()+20])
-                    med_text = match.group()
-                    if dosage_match:
-                        med_text += f" {dosage_match.group()}"
-                    medications.append({
-                        'text': med_text,
-                        'confidence': 0.95
-                    })
+        doc is the note's spaCy Doc when the caller has already processed it
+        (see analyze_notes); otherwise it is produced here.
+        """
+        spans = self._find_keywords(text)
         
-        # Extract procedures
-        procedures = []
-        for proc in self.procedure_patterns:
-            if proc in text_lower:
-                pattern = re.compile(re.escape(proc), re.IGNORECASE)
-                matches = pattern.finditer(text)
-                for match in matches:
-                    procedures.append({
-                        'text': match.group(),
-                        'confidence': 0.85
+        # Matches in keyword-list order, then by position within the note
+        entities = {}
+        for category, (patterns, confidence) in self.entity_categories.items():
+            found = []
+            for keyword in patterns:
+                for start, end in spans.get(keyword, []):
+                    entity_text = text[start:end]
+                    if category == 'medications':
+                        # Extract dosage if present
+                        dosage_match = self.dosage_pattern.search(text[max(0, start-10):end+20])
+                        if dosage_match:
+                            entity_text += f" {dosage_match.group()}"
+                    found.append({
+                        'text': entity_text,
+                        'confidence': confidence
                     })
+            entities[category] = found
         
-        # Extract diagnoses
-        diagnoses = []
-        for diag in self.diagnosis_patterns:
-            if diag in text_lower:
-                pattern = re.compile(re.escape(diag), re.IGNORECASE)
-                matches = pattern.finditer(text)
-                for match in matches:
-                    diagnoses.append({
-                        'text': match.group(),
-                        'confidence': 0.9
-                    })
+        symptoms = entities['symptoms']
+        medications = entities['medications']
+        procedures = entities['procedures']
+        diagnoses = entities['diagnoses']
         
         # Use spaCy for additional entity extraction if available
         if self.nlp:
-            doc = self.nlp(text)
+            if doc is None:
+                doc = next(self._spacy_docs([text]))
             for ent in doc.ents:
                 if ent.label_ in ['DISEASE', 'SYMPTOM', 'DRUG']:
                     # Add to appropriate category if not already found
@@ -154,6 +284,29 @@ class NLPAnalyzer:
             }
         
         entities = self.extract_entities(note_text)
+        return self._analysis(entities)
+    
+    def analyze_notes(self, note_texts, batch_size=NLP_BATCH_SIZE, n_process=NLP_N_PROCESS):
+        """Analyze many notes, streaming them through spaCy with nlp.pipe
+        
+        Returns one analyze_note result per note, in order. spaCy batches
+        batch_size notes at a time across n_process processes, with unused
+        pipeline components disabled.
+        """
+        note_texts = list(note_texts)
+        analyzable = [text for text in note_texts if text and text.strip()]
+        docs = self._spacy_docs(analyzable, batch_size, n_process) if self.nlp else None
+        
+        results = []
+        for text in note_texts:
+            if not text or not text.strip():
+                results.append(self.analyze_note(text))
+                continue
+            doc = next(docs) if docs is not None else None
+            results.append(self._analysis(self.extract_entities(text, doc)))
+        return results
+    
+    def _analysis(self, entities):
         summary = self.generate_summary(entities)
         
         return {
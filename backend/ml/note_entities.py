@@ -0,0 +1,143 @@
+from ml.nlp_analyzer import analyzer, NLP_BATCH_SIZE
+import hashlib
+import json
+
+# Notes analyzed and written back per transaction during a backfill
+BACKFILL_CHUNK_SIZE = 500
+
+# Hashes per note_analyses lookup (stays under SQLite's bound-parameter limit)
+LOOKUP_CHUNK_SIZE = 500
+
+def content_hash(text):
+    """Key a note's analysis by its exact text"""
+    return hashlib.sha256((text or '').encode('utf-8')).hexdigest()
+
+def _stored_analyses(conn, digests):
+    digests = list(digests)
+    found = {}
+    for start in range(0, len(digests), LOOKUP_CHUNK_SIZE):
+        chunk = digests[start:start + LOOKUP_CHUNK_SIZE]
+        rows = conn.execute(f'''
+            SELECT content_hash, result FROM note_analyses
+            WHERE analyzer_version = ? AND content_hash IN ({', '.join('?' * len(chunk))})
+        ''', (analyzer.version, *chunk))
+        found.update((row['content_hash'], json.loads(row['result'])) for row in rows)
+    return found
+
+def cached_analyses(conn, texts, batch_size=NLP_BATCH_SIZE, store=True):
+    """Analyze texts, reusing stored results for the same text and analyzer version
+    
+    Only texts never analyzed by the current analyzer version go through
+    analyzer.analyze_notes (once per distinct text); with store their
+    results are kept for next time. Returns one result per text, in order.
+    """
+    digests = [content_hash(text) for text in texts]
+    results = _stored_analyses(conn, set(digests))
+    
+    missing = {}
+    for digest, text in zip(digests, texts):
+        if digest not in results:
+            missing[digest] = text
+    
+    if missing:
+        analyses = analyzer.analyze_notes(missing.values(), batch_size=batch_size)
+        results.update(zip(missing, analyses))
+    
+    if missing and store:
+        conn.executemany('''
+            INSERT OR REPLACE INTO note_analyses (content_hash, analyzer_version, result)
+            VALUES (?, ?, ?)
+        ''', [(digest, analyzer.version, json.dumps(analysis)) for digest, analysis in zip(missing, analyses)])
+        conn.commit()
+    
+    return [results[digest] for digest in digests]
+
+def note_analyses(conn, notes, store=True):
+    """Map note id -> analysis for notes rows, analyzing stale ones
+    
+    A note's stored extracted_entities are reused while its analyzer_version
+    matches the current analyzer (editing note_text clears it). Stale notes
+    are written back only with store; without it nothing is written, so
+    reads stay read-only and the backfill stores them.
+    """
+    results = {}
+    stale = []
+    for note in notes:
+        if note['analyzer_version'] == analyzer.version and note['extracted_entities']:
+            results[note['id']] = json.loads(note['extracted_entities'])
+        else:
+            stale.append(note)
+    
+    if stale:
+        analyses = cached_analyses(conn, [note['note_text'] for note in stale], store=store)
+        results.update((note['id'], analysis) for note, analysis in zip(stale, analyses))
+    
+    if stale and store:
+        conn.executemany('''
+            UPDATE notes SET extracted_entities = ?, content_hash = ?, analyzer_version = ?
+            WHERE id = ?
+        ''', [
+            (json.dumps(analysis), content_hash(note['note_text']), analyzer.version, note['id'])
+            for note, analysis in zip(stale, analyses)
+        ])
+        conn.commit()
+    
+    return results
+
+def prune_note_analyses(conn, digests=None):
+    """Delete stored analyses no note uses any more, or made by another analyzer version
+    
+    Results of texts sent to the analyze endpoints without a note are
+    dropped too. With digests only those content hashes are checked (e.g.
+    the notes just deleted). Returns the number of rows deleted.
+    """
+    unused = '''
+        (analyzer_version IS NOT ? OR NOT EXISTS (
+            SELECT 1 FROM notes WHERE notes.content_hash = note_analyses.content_hash
+        ))
+    '''
+    if digests is None:
+        pruned = conn.execute(f'DELETE FROM note_analyses WHERE {unused}', (analyzer.version,)).rowcount
+    else:
+        digests = list(digests)
+        pruned = 0
+        for start in range(0, len(digests), LOOKUP_CHUNK_SIZE):
+            chunk = digests[start:start + LOOKUP_CHUNK_SIZE]
+            pruned += conn.execute(f'''
+                DELETE FROM note_analyses
+                WHERE content_hash IN ({', '.join('?' * len(chunk))}) AND {unused}
+            ''', (*chunk, analyzer.version)).rowcount
+    conn.commit()
+    return pruned
+
+def backfill_note_entities(conn, chunk_size=BACKFILL_CHUNK_SIZE, progress=None):
+    """Store analyses for every note not yet analyzed by the current analyzer
+    
+    Notes are read in id order, chunk_size at a time, and committed per
+    chunk. progress(current, total) is called after every chunk. Returns
+    the number of notes analyzed.
+    """
+    total = conn.execute(
+        'SELECT COUNT(*) FROM notes WHERE analyzer_version IS NOT ?', (analyzer.version,)
+    ).fetchone()[0]
+    if progress:
+        progress(0, total)
+    
+    analyzed = 0
+    last_id = 0
+    while True:
+        notes = conn.execute('''
+            SELECT * FROM notes
+            WHERE analyzer_version IS NOT ? AND id > ?
+            ORDER BY id LIMIT ?
+        ''', (analyzer.version, last_id, chunk_size)).fetchall()
+        if not notes:
+            break
+        last_id = notes[-1]['id']
+        
+        note_analyses(conn, notes)
+        analyzed += len(notes)
+        if progress:
+            progress(analyzed, total)
+    
+    return analyzed
@@ -0,0 +1,73 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Prediction payloads kept in memory per worker (0 disables the cache)
+PREDICTION_CACHE_SIZE = int(os.environ.get('PREDICTION_CACHE_SIZE', 10000))
+
+# Seconds a cached payload is served before it is recomputed
+PREDICTION_CACHE_TTL = float(os.environ.get('PREDICTION_CACHE_TTL', 300))
+
+class PredictionCache:
+    """Bounded LRU cache with a TTL for prediction payloads
+    
+    Keys are built by the caller (see RiskPredictor.predict): model
+    version, diagnosis and the feature vector, so a patient whose data or
+    model changed never hits a stale entry. Hit/miss/eviction counters are
+    kept for sizing.
+    """
+    
+    def __init__(self, max_entries=PREDICTION_CACHE_SIZE, ttl=PREDICTION_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get(self, key):
+        """Cached payload for key, or None"""
+        if self.max_entries <= 0:
+            return None
+        
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return dict(entry[1])
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+    
+    def put(self, key, payload):
+        if self.max_entries <= 0:
+            return
+        
+        with self._lock:
+            self._entries[key] = (time.monotonic(), dict(payload))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def clear(self):
+        """Drop every entry (the active model changed); counters are kept"""
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'maxEntries': self.max_entries,
+                'ttlSeconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hitRate': round(self.hits / lookups, 4) if lookups else None
+            }
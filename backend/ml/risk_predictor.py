@@ -1,20 +1,173 @@
 import numpy as np
-import pandas as pd
-from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
-from sklearn.linear_model import LogisticRegression
-from sklearn.tree import DecisionTreeClassifier
-from sklearn.preprocessing import StandardScaler
-from sklearn.model_selection import train_test_split
-import joblib
+import math
 import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict, namedtuple
 from datetime import datetime
+from itertools import islice
+
+from ml.model_registry import registry, MODEL_MMAP_MODE
+from ml.compiled_model import CompiledLinearModel, CompiledTreeEnsemble, export_fused_model
+from ml.explanations import NO_FACTORS, top_risk_factors
+from ml.prediction_cache import PredictionCache
+from ml.model_selection import (
+    CV_FOLDS, SMALL_DATA_CV_FOLDS, build_estimator, expand_search_space, small_data_search, successive_halving
+)
+
+# scikit-learn and joblib are imported on first use (loading or training a
+# model) so importing this module, and starting a worker, stays cheap
+
+# Patients scored per scaler/model call in predict_many
+PREDICT_CHUNK_SIZE = 5000
+
+# (feature name, patients/vitals column, default when missing or NULL)
+INPUT_COLUMNS = [
+    ('age', 'age', 50),
+    ('previous_admissions', 'previous_admissions', 0),
+    ('comorbidities', 'comorbidities', 0),
+    ('heart_rate', 'heart_rate', 75),
+    ('bp_systolic', 'blood_pressure_systolic', 120),
+    ('bp_diastolic', 'blood_pressure_diastolic', 80),
+    ('temperature', 'temperature', 37.0),
+    ('oxygen_saturation', 'oxygen_saturation', 98)
+]
+
+# Features kept as floats when converting matrix rows back to feature dicts
+FLOAT_FEATURES = {'temperature', 'diagnosis_risk'}
+
+# Candidate models compared by train_all_models: name -> (estimator class, hyperparameters).
+# train_all_models(candidates={name: {param: value}}) trains a subset and/or pins parameters.
+MODEL_CANDIDATES = {
+    'Random Forest': ('sklearn.ensemble.RandomForestClassifier', {'n_estimators': 100, 'max_depth': 10, 'random_state': 42, 'n_jobs': -1}),
+    'Logistic Regression': ('sklearn.linear_model.LogisticRegression', {'max_iter': 1000, 'random_state': 42}),
+    'Gradient Boosting': ('sklearn.ensemble.GradientBoostingClassifier', {'n_estimators': 100, 'random_state': 42}),
+    'Decision Tree': ('sklearn.tree.DecisionTreeClassifier', {'max_depth': 10, 'random_state': 42})
+}
+
+# Hyperparameter values searched per candidate (by ml.model_selection.successive_halving)
+# on top of MODEL_CANDIDATES; parameters pinned through candidates= are not searched
+SEARCH_SPACES = {
+    'Random Forest': {'max_depth': [6, 10, None], 'min_samples_leaf': [1, 5]},
+    'Logistic Regression': {'C': [0.1, 1.0, 10.0]},
+    'Gradient Boosting': {'learning_rate': [0.05, 0.1], 'max_depth': [2, 3]},
+    'Decision Tree': {'max_depth': [5, 10, None], 'min_samples_leaf': [1, 5, 20]}
+}
+
+# Hyperparameters a train request may pin per candidate, as (type, min, max);
+# values outside the range are clamped into it. None (no limit) is accepted
+# where the candidate's search space itself tries None.
+TUNABLE_PARAMS = {
+    'Random Forest': {'n_estimators': (int, 10, 500), 'max_depth': (int, 1, 30), 'min_samples_leaf': (int, 1, 100)},
+    'Logistic Regression': {'C': (float, 0.001, 1000.0), 'max_iter': (int, 100, 5000)},
+    'Gradient Boosting': {'n_estimators': (int, 10, 500), 'learning_rate': (float, 0.01, 1.0), 'max_depth': (int, 1, 8)},
+    'Decision Tree': {'max_depth': (int, 1, 30), 'min_samples_leaf': (int, 1, 100)}
+}
+
+# Processes used to fit the candidates concurrently (-1 = one per core)
+TRAINING_N_JOBS = int(os.environ.get('TRAINING_N_JOBS', -1))
+
+# Default cap, in seconds, on the hyperparameter search (unset = no limit)
+TRAINING_TIME_BUDGET = float(os.environ['TRAINING_TIME_BUDGET']) if os.environ.get('TRAINING_TIME_BUDGET') else None
+
+# Below this many training rows x configurations the search runs in-process,
+# where the fits finish faster than a process pool starts
+PARALLEL_TRAINING_MIN_ROWS = 20000
+
+# model_version of scores produced by the rule-based fallback
+RULE_BASED_VERSION = 'rule-based'
+
+# Seconds between checks of the registry's active version, so a model promoted
+# by another worker (or process) is picked up without a restart
+MODEL_RELOAD_INTERVAL = float(os.environ.get('MODEL_RELOAD_INTERVAL', 5))
+
+# Batches of up to this many rows are scored by the fused compiled tree engine
+# (ml.compiled_model) instead of scaler.transform + sklearn's predict_proba,
+# whose per-call overhead dominates small batches; larger ones are faster in
+# sklearn. Fused logistic regression is used for every batch. 0 disables both.
+COMPILED_INFERENCE_MAX_ROWS = int(os.environ.get('COMPILED_INFERENCE_MAX_ROWS', 1000))
+
+# The model serving predictions; replaced as a whole on train/promote/reload so
+# concurrent predictions never mix one version's model with another's scaler.
+# fused is the model with the scaler folded in (takes raw features), or None
+# when the model can't be compiled.
+ActiveModel = namedtuple('ActiveModel', ['model', 'scaler', 'name', 'version', 'accuracies', 'fused'])
+
+RULE_BASED_MODEL = ActiveModel(None, None, 'Rule-Based', RULE_BASED_VERSION, {}, None)
+
+def make_active_model(model, scaler, name, version, accuracies, fused=None):
+    """ActiveModel for a fitted model, exporting its fused predictor unless one is given"""
+    if COMPILED_INFERENCE_MAX_ROWS <= 0:
+        fused = None
+    elif fused is None:
+        fused = export_fused_model(model, scaler)
+    return ActiveModel(model, scaler, name, version, accuracies, fused)
+
+def _pinned_params(name, overrides):
+    """Check a candidate's pinned hyperparameters against TUNABLE_PARAMS and clamp them"""
+    if not isinstance(overrides, dict):
+        raise ValueError(f'Hyperparameters for {name} must be an object')
+    
+    tunable = TUNABLE_PARAMS[name]
+    unknown = [param for param in overrides if param not in tunable]
+    if unknown:
+        raise ValueError(f"Unknown hyperparameters for {name}: {', '.join(unknown)} "
+                         f"(allowed: {', '.join(tunable)})")
+    
+    pinned = {}
+    for param, value in overrides.items():
+        kind, low, high = tunable[param]
+        if value is None and None in SEARCH_SPACES.get(name, {}).get(param, []):
+            pinned[param] = None
+            continue
+        number = isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+        if not number or (kind is int and value != int(value)):
+            raise ValueError(f"{name} {param} must be {'an integer' if kind is int else 'a number'}")
+        pinned[param] = kind(min(max(value, low), high))
+    return pinned
+
+def resolve_candidates(candidates=None):
+    """Map candidate names to (estimator class path, hyperparameters, search space)
+    
+    candidates is None for every MODEL_CANDIDATES entry, or a dict of
+    name -> pinned parameters (or a list of names) to train a subset.
+    Pinned parameters are limited to TUNABLE_PARAMS; anything else raises
+    ValueError.
+    """
+    if candidates is None:
+        candidates = {name: {} for name in MODEL_CANDIDATES}
+    elif not isinstance(candidates, dict):
+        candidates = {name: {} for name in candidates}
+    
+    unknown = [name for name in candidates if not isinstance(name, str) or name not in MODEL_CANDIDATES]
+    if unknown:
+        raise ValueError(f"Unknown model candidates: {', '.join(map(str, unknown))}")
+    if not candidates:
+        raise ValueError('No model candidates selected')
+    
+    resolved = {}
+    for name, overrides in candidates.items():
+        overrides = _pinned_params(name, {} if overrides is None else overrides)
+        estimator_path, params = MODEL_CANDIDATES[name]
+        search_space = {
+            param: values for param, values in SEARCH_SPACES.get(name, {}).items()
+            if param not in overrides
+        }
+        resolved[name] = (estimator_path, {**params, **overrides}, search_space)
+    return resolved
+
+def _fit_candidate(name, estimator_path, params, X_train, y_train, X_test, y_test):
+    """Fit one candidate on the full training set and score it on the held-out set"""
+    started = time.perf_counter()
+    model = build_estimator(estimator_path, params)
+    model.fit(X_train, y_train)
+    accuracy = model.score(X_test, y_test)
+    return name, model, accuracy, time.perf_counter() - started
 
 class RiskPredictor:
     def __init__(self):
         self.models = {}
-        self.active_model = None
-        self.active_model_name = 'Random Forest'
-        self.scaler = StandardScaler()
         self.feature_names = [
             'age', 'length_of_stay', 'previous_admissions', 'comorbidities',
             'heart_rate', 'bp_systolic', 'bp_diastolic', 'temperature', 'oxygen_saturation',
@@ -32,36 +185,164 @@ class RiskPredictor:
             'Hip Fracture': 0.5,
             'Urinary Tract Infection': 0.3
         }
-        self.is_trained = False
-        self.model_accuracies = {}
-        
-        # Try to load pre-trained model
-        self._load_model()
+        self.training_times = {}
+        self._active = RULE_BASED_MODEL
+        self.prediction_cache = PredictionCache()
+        
+        # The active model is loaded on first use, not at import time
+        self._loaded = False
+        self._checked_at = 0.0
+        self._load_lock = threading.Lock()
+    
+    def ensure_loaded(self):
+        """Load the active model on first use and pick up newly promoted ones
+        
+        The first call loads the registry's active version (call it directly
+        to pay that cost up front, see preload_models). Later calls re-read
+        the registry's active pointer at most every MODEL_RELOAD_INTERVAL
+        seconds and hot-swap the model if another process promoted one.
+        """
+        now = time.monotonic()
+        if self._loaded and now - self._checked_at < MODEL_RELOAD_INTERVAL:
+            return
+        with self._load_lock:
+            if not self._loaded:
+                self._load_model()
+                self._loaded = True
+            elif now - self._checked_at >= MODEL_RELOAD_INTERVAL:
+                self._reload_if_promoted()
+            self._checked_at = now
+    
+    @property
+    def active(self):
+        """The ActiveModel currently serving predictions"""
+        self.ensure_loaded()
+        return self._active
+    
+    @property
+    def is_trained(self):
+        return self.active.model is not None
+    
+    @property
+    def active_model(self):
+        return self.active.model
+    
+    @property
+    def scaler(self):
+        return self.active.scaler
+    
+    @property
+    def active_model_name(self):
+        return self.active.name
+    
+    @property
+    def model_version(self):
+        """Stored with every persisted score so rescoring can skip up-to-date patients"""
+        return self.active.version
+    
+    @property
+    def model_accuracies(self):
+        return self.active.accuracies
     
     def _load_model(self):
-        """Load pre-trained model if exists"""
+        """Load the registry's active model, or a pre-registry pickle if that is all there is"""
+        version = registry.active_version()
+        if version:
+            try:
+                self._activate(version)
+                print(f"✅ Loaded ML model {self._active.name} (version {version})")
+            except Exception as e:
+                print(f"⚠️  Could not load model version {version}: {e}")
+            return
+        
         model_path = 'risk_model.pkl'
         scaler_path = 'risk_scaler.pkl'
         
         if os.path.exists(model_path) and os.path.exists(scaler_path):
             try:
-                self.active_model = joblib.load(model_path)
-                self.scaler = joblib.load(scaler_path)
-                self.is_trained = True
+                import joblib
+                self._set_active(make_active_model(
+                    joblib.load(model_path, mmap_mode=MODEL_MMAP_MODE),
+                    joblib.load(scaler_path, mmap_mode=MODEL_MMAP_MODE),
+                    'Random Forest', self._artifact_version(model_path), {}
+                ))
                 print("✅ Loaded pre-trained ML model")
             except Exception as e:
                 print(f"⚠️  Could not load model: {e}")
-                self.is_trained = False
     
-    def _save_model(self):
-        """Save trained model"""
+    def _activate(self, version):
+        model, scaler, manifest = registry.load(version)
+        fused = (registry.load_fused(version) or {}).get(manifest['activeModel'])
+        self._set_active(make_active_model(
+            model, scaler, manifest['activeModel'], version, manifest['accuracies'], fused
+        ))
+    
+    def _set_active(self, active):
+        """Swap in a new active model and drop predictions cached for the old one"""
+        self._active = active
+        self.prediction_cache.clear()
+    
+    def _reload_if_promoted(self):
         try:
-            joblib.dump(self.active_model, 'risk_model.pkl')
-            joblib.dump(self.scaler, 'risk_scaler.pkl')
-            joblib.dump(self.models, 'all_models.pkl')
-            print("✅ Saved trained ML models")
+            version = registry.active_version()
+            if version and version != self._active.version:
+                self._activate(version)
+                print(f"🔄 Reloaded ML model version {version}")
+        except Exception as e:
+            print(f"⚠️  Could not reload model: {e}")
+    
+    def promote(self, version):
+        """Make a registered version active here and, via the registry, in every worker"""
+        self.ensure_loaded()
+        registry.promote(version)
+        with self._load_lock:
+            self._activate(version)
+        return version
+    
+    def rollback(self):
+        """Re-activate the previously active version here and in every worker"""
+        self.ensure_loaded()
+        version = registry.rollback()
+        with self._load_lock:
+            self._activate(version)
+        return version
+    
+    def _save_model(self, models, model_name, scaler, accuracies, details):
+        """Register the trained models as a new version, promote it and serve it
+        
+        details (training sizes, timings, search summary) goes into the
+        version's manifest. If registering fails the error is raised and
+        the previously active version keeps serving.
+        """
+        import numpy
+        import sklearn
+        
+        # Export step: each candidate with the scaler folded in, ready to serve
+        fused = {name: export_fused_model(model, scaler) for name, model in models.items()}
+        
+        try:
+            version = registry.register(models[model_name], scaler, models, {
+                'activeModel': model_name,
+                'featureNames': self.feature_names,
+                'accuracies': accuracies,
+                **details,
+                'libraries': {'scikit-learn': sklearn.__version__, 'numpy': numpy.__version__}
+            }, fused)
+            registry.promote(version)
+            print(f"✅ Saved trained ML models (version {version})")
         except Exception as e:
             print(f"⚠️  Could not save models: {e}")
+            raise
+        
+        self.models = models
+        self._set_active(make_active_model(
+            models[model_name], scaler, model_name, version, accuracies, fused[model_name]
+        ))
+        return version
+    
+    def _artifact_version(self, path):
+        """Version string for a saved model artifact, derived from its mtime"""
+        return datetime.fromtimestamp(os.path.getmtime(path)).strftime('%Y%m%d%H%M%S%f')
     
     def extract_features(self, patient_data):
         """Extract and normalize features from patient data"""
@@ -79,27 +360,86 @@ class RiskPredictor:
         diagnosis = patient_data.get('diagnosis', '')
         diagnosis_risk = self.diagnosis_risk_map.get(diagnosis, 0.4)
         
-        features = {
-            'age': patient_data.get('age', 50),
-            'length_of_stay': max(los, 0),
-            'previous_admissions': patient_data.get('previous_admissions', 0),
-            'comorbidities': patient_data.get('comorbidities', 0),
-            'heart_rate': patient_data.get('heart_rate', 75),
-            'bp_systolic': patient_data.get('blood_pressure_systolic', 120),
-            'bp_diastolic': patient_data.get('blood_pressure_diastolic', 80),
-            'temperature': patient_data.get('temperature', 37.0),
-            'oxygen_saturation': patient_data.get('oxygen_saturation', 98),
-            'diagnosis_risk': diagnosis_risk
-        }
+        features = {'length_of_stay': max(los, 0), 'diagnosis_risk': diagnosis_risk}
+        for name, column, default in INPUT_COLUMNS:
+            # NULL vitals from the LEFT JOIN fall back to the default as well
+            value = patient_data.get(column)
+            features[name] = default if value is None else value
         
-        return features
+        return {name: features[name] for name in self.feature_names}
+    
+    def extract_feature_matrix(self, patient_rows):
+        """Columnar counterpart of extract_features for a whole result set
+        
+        Reads sqlite3.Row objects (or dicts) straight into typed NumPy columns,
+        computes length of stay with datetime64 arithmetic and maps diagnoses
+        through a categorical code lookup. Returns the feature matrix in
+        feature_names order plus the diagnosis string of every row.
+        """
+        patient_rows = list(patient_rows)
+        if not patient_rows:
+            return np.empty((0, len(self.feature_names))), np.empty(0, dtype=str)
+        
+        if isinstance(patient_rows[0], sqlite3.Row):
+            columns = list(patient_rows[0].keys())
+            table = np.array(patient_rows, dtype=object).reshape(len(patient_rows), len(columns))
+        else:
+            columns = [column for _, column, _ in INPUT_COLUMNS] + ['admission_date', 'discharge_date', 'diagnosis']
+            table = np.array([[row.get(column) for column in columns] for row in patient_rows], dtype=object)
+        
+        def column_values(column):
+            if column not in columns:
+                return np.full(len(patient_rows), None, dtype=object)
+            return table[:, columns.index(column)]
+        
+        features = {}
+        for name, column, default in INPUT_COLUMNS:
+            values = column_values(column)
+            features[name] = np.where(np.equal(values, None), default, values).astype(np.float64)
+        
+        # Length of stay; NULL or empty discharge dates parse as NaT (still admitted)
+        admission = np.array(column_values('admission_date').tolist(), dtype='datetime64[D]')
+        discharge = np.array(column_values('discharge_date').tolist(), dtype='datetime64[D]')
+        today = np.datetime64(datetime.now().date(), 'D')
+        los = np.where(np.isnat(discharge), today, discharge) - admission
+        features['length_of_stay'] = np.maximum(los.astype(np.int64), 0).astype(np.float64)
+        
+        # Diagnosis risk via categorical codes: one dict lookup per distinct diagnosis
+        diagnosis_values = column_values('diagnosis')
+        diagnoses = np.where(np.equal(diagnosis_values, None), '', diagnosis_values).astype(str)
+        categories, codes = np.unique(diagnoses, return_inverse=True)
+        category_risk = np.array([self.diagnosis_risk_map.get(category, 0.4) for category in categories])
+        features['diagnosis_risk'] = category_risk[codes].reshape(-1)
+        
+        X = np.column_stack([features[name] for name in self.feature_names])
+        return X, diagnoses
     
-    def train_all_models(self, patient_data_list):
-        """Train multiple ML models and compare performance"""
+    def train_all_models(self, patient_data_list, candidates=None, time_budget=None):
+        """Select the best candidate model by cross-validated successive halving
+        
+        Every candidate/hyperparameter combination (MODEL_CANDIDATES x
+        SEARCH_SPACES) is cross-validated on growing subsamples of the
+        training split, each candidate's best configuration is refit on all
+        of it and the overall winner is served. candidates selects which
+        candidates to search and pins their parameters (see
+        resolve_candidates); time_budget caps the search in seconds
+        (default TRAINING_TIME_BUDGET), not the refits after it. Returns the
+        CV accuracy of each candidate's best configuration.
+        """
         if len(patient_data_list) < 10:
             print("⚠️  Need at least 10 patients to train models")
             return False
         
+        from sklearn.preprocessing import StandardScaler
+        from sklearn.model_selection import train_test_split
+        
+        model_configs = resolve_candidates(candidates)
+        if time_budget is None:
+            time_budget = TRAINING_TIME_BUDGET
+        
+        # Don't let a later first-use load replace the models trained here
+        self.ensure_loaded()
+        
         # Extract features for all patients
         X = []
         y = []
@@ -121,48 +461,102 @@ class RiskPredictor:
         
         X = np.array(X)
         y = np.array(y)
+        if len(np.unique(y)) < 2:
+            print("⚠️  Need both high- and low-risk patients to train models")
+            return False
         
-        # Split data
+        # Hold out a split for the winner's final accuracy; the search cross-validates on the rest
         X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
         
         # Scale features
-        X_train_scaled = self.scaler.fit_transform(X_train)
-        X_test_scaled = self.scaler.transform(X_test)
-        
-        # Define models to train
-        model_configs = {
-            'Random Forest': RandomForestClassifier(n_estimators=100, max_depth=10, random_state=42),
-            'Logistic Regression': LogisticRegression(max_iter=1000, random_state=42),
-            'Gradient Boosting': GradientBoostingClassifier(n_estimators=100, random_state=42),
-            'Decision Tree': DecisionTreeClassifier(max_depth=10, random_state=42)
-        }
-        
-        # Train all models
-        results = {}
-        for name, model in model_configs.items():
-            model.fit(X_train_scaled, y_train)
-            accuracy = model.score(X_test_scaled, y_test)
-            self.models[name] = model
-            self.model_accuracies[name] = accuracy
-            results[name] = accuracy
-            print(f"✅ {name}: {accuracy:.2%} accuracy")
-        
-        # Set best model as active
-        best_model_name = max(results, key=results.get)
-        self.active_model = self.models[best_model_name]
-        self.active_model_name = best_model_name
-        self.is_trained = True
-        
-        print(f"\n🏆 Best Model: {best_model_name} with {results[best_model_name]:.2%} accuracy")
-        
-        # Save models
-        self._save_model()
+        scaler = StandardScaler()
+        X_train_scaled = scaler.fit_transform(X_train)
+        X_test_scaled = scaler.transform(X_test)
+        
+        # One search configuration per candidate and hyperparameter combination;
+        # too few rows to search on just compare the candidates' defaults
+        small_data = small_data_search(len(X_train))
+        if small_data:
+            print(f"💡 {len(X_train)} training rows: comparing default hyperparameters only")
+        names = []
+        configs = []
+        for name, (estimator_path, params, search_space) in model_configs.items():
+            for config_params in expand_search_space(params, None if small_data else search_space):
+                names.append(name)
+                configs.append((estimator_path, config_params))
+        
+        n_jobs = TRAINING_N_JOBS if len(X_train) * len(configs) >= PARALLEL_TRAINING_MIN_ROWS else 1
+        started = time.perf_counter()
+        search = successive_halving(
+            configs, X_train_scaled, y_train, time_budget=time_budget, n_jobs=n_jobs,
+            cv_folds=SMALL_DATA_CV_FOLDS if small_data else CV_FOLDS
+        )
+        
+        for rung, summary in enumerate(search.rungs):
+            print(f"🔎 Rung {rung + 1}: {summary['configs']} configs x {search.folds} folds "
+                  f"on {summary['rows']} rows ({summary['seconds']:.2f}s)")
+        if search.stopped_early:
+            print(f"⏱️  Search stopped early to stay within the {time_budget:.0f}s budget")
+        
+        # Each candidate is represented by its furthest-surviving, best-scoring configuration
+        best_configs = {}
+        training_times = defaultdict(float)
+        for index, name in enumerate(names):
+            training_times[name] += search.fit_seconds[index]
+            if index in search.scores and (
+                name not in best_configs or search.scores[index] > search.scores[best_configs[name]]
+            ):
+                best_configs[name] = index
+        results = {name: search.scores[index][1] for name, index in best_configs.items()}
+        
+        for name, accuracy in results.items():
+            print(f"✅ {name}: {accuracy:.2%} CV accuracy ({training_times[name]:.2f}s)")
+        
+        # Refit every candidate's configuration on the whole training split, so
+        # the version stores and compares each one (one fit per candidate, outside the budget)
+        from joblib import Parallel, delayed
+        
+        refits = Parallel(n_jobs=n_jobs)(
+            delayed(_fit_candidate)(name, *configs[index], X_train_scaled, y_train, X_test_scaled, y_test)
+            for name, index in best_configs.items()
+        )
+        models = {name: model for name, model, _, _ in refits}
+        test_accuracies = {name: accuracy for name, _, accuracy, _ in refits}
+        total_seconds = time.perf_counter() - started
+        
+        training_times = {name: round(seconds, 3) for name, seconds in training_times.items()}
+        training_times['refit'] = round(sum(seconds for _, _, _, seconds in refits), 3)
+        training_times['total'] = round(total_seconds, 3)
+        print(f"⏱️  Searched {len(configs)} configurations and refit {len(refits)} in {total_seconds:.2f}s")
+        
+        self.training_times = training_times
+        
+        best_model_name = names[search.best]
+        print(f"\n🏆 Best Model: {best_model_name} with {results[best_model_name]:.2%} CV accuracy "
+              f"({test_accuracies[best_model_name]:.2%} on the held-out split)")
+        
+        # Register as a new version and make it active
+        self._save_model(models, best_model_name, scaler, results, {
+            'trainingSize': len(X_train),
+            'testSize': len(X_test),
+            'testAccuracy': test_accuracies[best_model_name],
+            'testAccuracies': test_accuracies,
+            'bestParams': configs[search.best][1],
+            'candidateParams': {name: configs[index][1] for name, index in best_configs.items()},
+            'search': {
+                'configurations': len(configs),
+                'cvFolds': search.folds,
+                'rungs': search.rungs,
+                'stoppedEarly': search.stopped_early
+            },
+            'trainingSeconds': training_times
+        })
         
         return results
     
-    def train_model(self, patient_data_list):
+    def train_model(self, patient_data_list, candidates=None, time_budget=None):
         """Train models (wrapper for backward compatibility)"""
-        return self.train_all_models(patient_data_list)
+        return self.train_all_models(patient_data_list, candidates, time_budget)
     
     def calculate_risk_score(self, patient_data):
         """Calculate risk score using rule-based system (for demo without trained model)"""
@@ -204,6 +598,28 @@ class RiskPredictor:
         
         return risk_score, features
     
+    def calculate_risk_scores(self, X):
+        """Vectorized calculate_risk_score over a feature matrix from extract_feature_matrix"""
+        f = {name: X[:, i] for i, name in enumerate(self.feature_names)}
+        
+        # Same factors, in the same order, as the scalar rule-based score
+        age_factor = np.minimum((f['age'] - 25) / 65, 1.0) * 0.3
+        admission_factor = np.minimum(f['previous_admissions'] / 5, 1.0) * 0.2
+        comorbidity_factor = np.minimum(f['comorbidities'] / 4, 1.0) * 0.15
+        
+        vital_risk = np.zeros(len(X))
+        vital_risk += np.where((f['heart_rate'] > 100) | (f['heart_rate'] < 60), 0.1, 0.0)
+        vital_risk += np.where((f['bp_systolic'] > 140) | (f['bp_systolic'] < 100), 0.1, 0.0)
+        vital_risk += np.where(f['temperature'] > 38.0, 0.1, 0.0)
+        vital_risk += np.where(f['oxygen_saturation'] < 95, 0.15, 0.0)
+        
+        los_factor = np.minimum(f['length_of_stay'] / 14, 1.0) * 0.1
+        
+        total_risk = f['diagnosis_risk'] + age_factor + admission_factor + comorbidity_factor + vital_risk + los_factor
+        total_risk = np.minimum(total_risk, 1.0)
+        
+        return (total_risk * 100).astype(int)
+    
     def get_risk_level(self, risk_score):
         """Convert risk score to risk level"""
         if risk_score < 40:
@@ -254,7 +670,7 @@ class RiskPredictor:
             factors.append(f"Extended hospital stay ({features['length_of_stay']} days)")
         
         # Return top 3 factors
-        return factors[:3] if factors else ["No significant risk factors identified"]
+        return factors[:3] if factors else [NO_FACTORS]
     
     def get_recommendations(self, risk_level, factors):
         """Generate recommendations based on risk level"""
@@ -273,49 +689,161 @@ class RiskPredictor:
         
         return recommendations
     
+    def _build_prediction(self, patient_data, features, risk_score, confidence, active, top_factors=None):
+        """Assemble the prediction payload for one patient
+        
+        top_factors comes from the model's feature contributions (see
+        _score_and_explain); without them the rule-based factors are used.
+        """
+        risk_level = self.get_risk_level(risk_score)
+        if top_factors is None:
+            top_factors = self.get_top_risk_factors(patient_data, features)
+        recommendations = self.get_recommendations(risk_level, top_factors)
+        
+        return {
+            'riskScore': risk_score,
+            'riskLevel': risk_level,
+            'topFactors': top_factors,
+            'confidence': round(confidence, 2),
+            'recommendations': recommendations,
+            'modelType': active.name if active.model is not None else 'Rule-Based',
+            'modelVersion': active.version
+        }
+    
+    def _risk_probabilities(self, active, X):
+        """P(high risk) per row of the raw feature matrix, from the fused model when it is faster"""
+        fused = active.fused
+        if fused is not None and (isinstance(fused, CompiledLinearModel) or len(X) <= COMPILED_INFERENCE_MAX_ROWS):
+            return fused.predict_proba(X)
+        return active.model.predict_proba(active.scaler.transform(X))[:, 1]
+    
+    def _score_and_explain(self, active, X, diagnoses):
+        """Risk probabilities and top factors for every row of the raw feature matrix X
+        
+        With a fused model both come from one pass (its explain()), the
+        factors from the model's per-feature contributions (see
+        ml.explanations). Without one the factors are None and
+        _build_prediction falls back to the rule-based ones.
+        """
+        fused = active.fused
+        if fused is None:
+            return self._risk_probabilities(active, X), None
+        
+        if isinstance(fused, CompiledTreeEnsemble) and len(X) > COMPILED_INFERENCE_MAX_ROWS:
+            # sklearn's apply() finds the leaves of large batches faster than the compiled traversal
+            nodes = fused.nodes_from_apply(active.model.apply(active.scaler.transform(X)))
+            risk_probabilities, contributions = fused.explain_leaves(nodes, X.shape[1])
+        else:
+            risk_probabilities, contributions = fused.explain(X)
+        return risk_probabilities, top_risk_factors(contributions, X, diagnoses, self.feature_names)
+    
     def predict(self, patient_data):
-        """Main prediction method using ML model or fallback to rule-based"""
+        """Main prediction method using ML model or fallback to rule-based
+        
+        Payloads are cached by model version, diagnosis and feature vector
+        (see ml.prediction_cache), so repeat requests for an unchanged
+        patient skip the model and the explanation.
+        """
         features = self.extract_features(patient_data)
+        active = self.active
+        
+        cache_key = (active.version, patient_data.get('diagnosis', ''), tuple(features[name] for name in self.feature_names))
+        cached = self.prediction_cache.get(cache_key)
+        if cached is not None:
+            return cached
         
-        if self.is_trained and self.active_model is not None:
+        if active.model is not None:
             # Use ML model
             feature_vector = np.array([[features[name] for name in self.feature_names]])
-            feature_vector_scaled = self.scaler.transform(feature_vector)
             
-            # Get probability prediction
-            risk_probability = self.active_model.predict_proba(feature_vector_scaled)[0][1]
-            risk_score = int(risk_probability * 100)
+            # Get probability prediction and the model's top factors
+            risk_probabilities, top_factors = self._score_and_explain(active, feature_vector, [patient_data.get('diagnosis', '')])
+            risk_score = int(risk_probabilities[0] * 100)
             
-            confidence = self.model_accuracies.get(self.active_model_name, 0.85)
+            confidence = active.accuracies.get(active.name, 0.85)
         else:
             # Fallback to rule-based
             risk_score, _ = self.calculate_risk_score(patient_data)
             confidence = 0.75
+            top_factors = None
         
-        risk_level = self.get_risk_level(risk_score)
-        top_factors = self.get_top_risk_factors(patient_data, features)
-        recommendations = self.get_recommendations(risk_level, top_factors)
+        prediction = self._build_prediction(
+            patient_data, features, risk_score, confidence, active, top_factors[0] if top_factors else None
+        )
+        self.prediction_cache.put(cache_key, prediction)
+        return prediction
+    
+    def predict_many(self, patient_data_list, chunk_size=PREDICT_CHUNK_SIZE):
+        """Batch prediction: one scaler/model call per chunk instead of per patient
+        
+        Accepts any iterable of patient dicts and returns the predictions in the
+        same order, each identical to what predict() returns for that patient.
+        A patient that can't be scored (e.g. a malformed admission_date) gets
+        None instead of failing the rest of its chunk.
+        """
+        predictions = []
+        patients = iter(patient_data_list)
+        while True:
+            chunk = list(islice(patients, chunk_size))
+            if not chunk:
+                break
+            try:
+                predictions.extend(self._predict_chunk(chunk))
+            except (ValueError, TypeError):
+                # One bad row fails the whole vectorized chunk; score it row by row instead
+                predictions.extend(self._predict_rows(chunk))
+        return predictions
+    
+    def _predict_rows(self, chunk):
+        """predict() each patient of a chunk, with None for the ones that fail"""
+        predictions = []
+        for patient in chunk:
+            patient = dict(patient)
+            try:
+                predictions.append(self.predict(patient))
+            except Exception as e:
+                print(f"⚠️  Could not score patient {patient.get('patient_id', '?')}: {e}")
+                predictions.append(None)
+        return predictions
+    
+    def _predict_chunk(self, chunk):
+        """Score and explain one chunk of patients with a single model call"""
+        X, diagnosis_array = self.extract_feature_matrix(chunk)
+        active = self.active
+        
+        diagnoses = diagnosis_array.tolist()
+        features_list = [
+            {name: value if name in FLOAT_FEATURES else int(value) for name, value in zip(self.feature_names, row)}
+            for row in X.tolist()
+        ]
         
-        return {
-            'riskScore': risk_score,
-            'riskLevel': risk_level,
-            'topFactors': top_factors,
-            'confidence': round(confidence, 2),
-            'recommendations': recommendations,
-            'modelType': self.active_model_name if self.is_trained else 'Rule-Based'
-        }
+        if active.model is not None:
+            risk_probabilities, top_factors = self._score_and_explain(active, X, diagnosis_array)
+            risk_scores = (risk_probabilities * 100).astype(int).tolist()
+            confidence = active.accuracies.get(active.name, 0.85)
+        else:
+            risk_scores = self.calculate_risk_scores(X).tolist()
+            confidence = 0.75
+            top_factors = None
+        
+        return [
+            self._build_prediction({'diagnosis': diagnosis}, features, risk_score, confidence, active, factors)
+            for features, diagnosis, risk_score, factors
+            in zip(features_list, diagnoses, risk_scores, top_factors or [None] * len(features_list))
+        ]
     
     def get_model_comparison(self):
-        """Get comparison of all trained models"""
-        if not self.models:
+        """Get comparison of the models trained for the active version"""
+        active = self.active
+        if not active.accuracies:
             return None
         
         comparison = []
-        for name, accuracy in self.model_accuracies.items():
+        for name, accuracy in active.accuracies.items():
             comparison.append({
                 'name': name,
                 'accuracy': round(accuracy, 4),
-                'isActive': name == self.active_model_name
+                'isActive': name == active.name
             })
         
         return sorted(comparison, key=lambda x: x['accuracy'], reverse=True)
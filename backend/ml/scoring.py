@@ -0,0 +1,141 @@
+from ml.risk_predictor import predictor
+from models.database import PATIENTS_WITH_VITALS, bump_data_generation
+from datetime import date
+from itertools import islice
+import json
+import os
+
+# Patients read, scored and written back per transaction during rescoring
+WRITE_BACK_CHUNK_SIZE = int(os.environ.get('RISK_WRITE_BACK_CHUNK_SIZE', 1000))
+
+# Prediction fields stored in risk_explanations; the score, level and version
+# come from the patients row
+EXPLANATION_FIELDS = ('topFactors', 'confidence', 'recommendations', 'modelType')
+
+def explanation_payload(prediction, as_of):
+    """Compact JSON of the explanation fields of a prediction made on as_of (an ISO date)"""
+    payload = {field: prediction[field] for field in EXPLANATION_FIELDS}
+    payload['asOf'] = as_of
+    return json.dumps(payload, separators=(',', ':'))
+
+def stored_prediction(conn, patient):
+    """Prediction payload stored by the last rescore of patient, or None if out of date
+    
+    patient is a patients row. Its score is current when risk_model_version
+    is the active model version (changed inputs reset it to NULL); the
+    explanation is then read with one primary-key lookup, without calling
+    the model. A still-admitted patient's length of stay grows every day,
+    so their stored prediction only holds on the day it was made.
+    """
+    model_version = predictor.model_version
+    if patient['risk_model_version'] != model_version:
+        return None
+    
+    row = conn.execute(
+        'SELECT payload FROM risk_explanations WHERE patient_id = ? AND model_version = ?',
+        (patient['patient_id'], model_version)
+    ).fetchone()
+    if row is None:
+        return None
+    
+    payload = json.loads(row['payload'])
+    as_of = payload.pop('asOf', None)
+    if not patient['discharge_date'] and as_of != date.today().isoformat():
+        return None
+    
+    return {
+        'riskScore': int(patient['risk_score']),
+        'riskLevel': patient['risk_level'],
+        **payload,
+        'modelVersion': model_version
+    }
+
+def write_back_scores(conn, scores, chunk_size=WRITE_BACK_CHUNK_SIZE, on_commit=None):
+    """Flush (risk_score, risk_level, model_version, patient_id, explanation) tuples
+    
+    explanation is the JSON from explanation_payload, stored in
+    risk_explanations under the same model version.
+    
+    Rows are written with executemany in chunks of chunk_size and committed
+    per chunk, so a long rescoring run only holds the SQLite write lock for
+    one chunk at a time. on_commit(written) is called after every chunk.
+    Returns the number of rows written.
+    """
+    cursor = conn.cursor()
+    scores = iter(scores)
+    written = 0
+    
+    while True:
+        chunk = list(islice(scores, chunk_size))
+        if not chunk:
+            break
+        cursor.executemany('''
+            UPDATE patients
+            SET risk_score = ?, risk_level = ?, risk_model_version = ?
+            WHERE patient_id = ?
+        ''', [row[:4] for row in chunk])
+        cursor.executemany('''
+            INSERT OR REPLACE INTO risk_explanations (patient_id, model_version, payload)
+            VALUES (?, ?, ?)
+        ''', [(patient_id, model_version, explanation) for _, _, model_version, patient_id, explanation in chunk])
+        conn.commit()
+        written += len(chunk)
+        if on_commit:
+            on_commit(written)
+    
+    return written
+
+def _score_pages(conn, force_full, page_size):
+    """Read out-of-date patients page by page and yield their write-back tuples"""
+    cursor = conn.cursor()
+    model_version = predictor.model_version
+    last_id = 0
+    
+    while True:
+        query = PATIENTS_WITH_VITALS + ' WHERE p.id > ?'
+        params = [last_id]
+        if not force_full:
+            query += ' AND p.risk_model_version IS NOT ?'
+            params.append(model_version)
+        query += ' ORDER BY p.id LIMIT ?'
+        params.append(page_size)
+        
+        patients = cursor.execute(query, params).fetchall()
+        if not patients:
+            break
+        last_id = patients[-1]['id']
+        
+        as_of = date.today().isoformat()
+        predictions = predictor.predict_many(patients)
+        for patient, prediction in zip(patients, predictions):
+            if prediction is None:
+                continue  # Unscorable row; left out of date and retried on the next rescore
+            yield (
+                prediction['riskScore'], prediction['riskLevel'], prediction['modelVersion'],
+                patient['patient_id'], explanation_payload(prediction, as_of)
+            )
+
+def rescore_patients(conn, force_full=False, chunk_size=WRITE_BACK_CHUNK_SIZE, progress=None):
+    """Recompute and store risk scores, touching only patients that need it
+    
+    A patient is rescored when its risk_model_version is NULL (new row, or
+    inputs/vitals changed since the last score) or differs from the active
+    model version. force_full rescores everyone, e.g. after a model swap that
+    kept the same version. progress(current, total) is called as chunks are
+    committed. Returns the number of patients rescored.
+    """
+    on_commit = None
+    if progress:
+        query = 'SELECT COUNT(*) FROM patients'
+        params = []
+        if not force_full:
+            query += ' WHERE risk_model_version IS NOT ?'
+            params.append(predictor.model_version)
+        total = conn.execute(query, params).fetchone()[0]
+        progress(0, total)
+        on_commit = lambda written: progress(written, total)
+    
+    rescored = write_back_scores(conn, _score_pages(conn, force_full, chunk_size), chunk_size, on_commit)
+    if rescored:
+        bump_data_generation(conn)
+    return rescored
@@ -1,14 +1,450 @@
 import sqlite3
 import os
+import re
+import sys
+import threading
+from flask import g
 
 DATABASE_PATH = 'healthcare.db'
 
+# Every patient joined with exactly one vitals row: its most recent one
+PATIENTS_WITH_VITALS = '''
+    SELECT p.*, v.heart_rate, v.blood_pressure_systolic, v.blood_pressure_diastolic,
+           v.temperature, v.oxygen_saturation
+    FROM patients p
+    LEFT JOIN latest_vitals v ON p.patient_id = v.patient_id
+'''
+
+# Julian day that admission days are stored relative to, which keeps the
+# running sums small enough that float rounding does not build up
+LOS_EPOCH_JULIANDAY = 2451545.0  # 2000-01-01
+
+# Running sums kept per dashboard bucket, as column -> contribution of one row.
+# Length of stay for still-admitted patients grows with time, so those rows
+# contribute their admission day and the average is finished at read time.
+DASHBOARD_MEASURES = {
+    'patients': '1',
+    'high_risk': "COALESCE({row}.risk_level = 'high', 0)",
+    'readmissions': 'COALESCE({row}.previous_admissions > 0, 0)',
+    'risk_count': '{row}.risk_score IS NOT NULL',
+    'risk_sum': 'COALESCE({row}.risk_score, 0)',
+    'discharged_count': '''{row}.discharge_date IS NOT NULL
+        AND julianday({row}.discharge_date) - julianday({row}.admission_date) IS NOT NULL''',
+    'discharged_los_sum': '''COALESCE(CASE WHEN {row}.discharge_date IS NOT NULL
+        THEN julianday({row}.discharge_date) - julianday({row}.admission_date) END, 0)''',
+    'admitted_count': '''{row}.discharge_date IS NULL
+        AND julianday({row}.admission_date) IS NOT NULL''',
+    'admitted_day_sum': f'''COALESCE(CASE WHEN {{row}}.discharge_date IS NULL
+        THEN julianday({{row}}.admission_date) - {LOS_EPOCH_JULIANDAY} END, 0)'''
+}
+
+# Every dimension the dashboard charts group patients by, as (name, bucket
+# expression over a patients row, measures maintained for its buckets)
+DASHBOARD_DIMENSIONS = [
+    ('total', "''", list(DASHBOARD_MEASURES)),
+    ('risk_range', '''CASE
+        WHEN {row}.risk_score IS NULL THEN ''
+        WHEN {row}.risk_score < 20 THEN '0-20'
+        WHEN {row}.risk_score < 40 THEN '20-40'
+        WHEN {row}.risk_score < 60 THEN '40-60'
+        WHEN {row}.risk_score < 80 THEN '60-80'
+        ELSE '80-100'
+    END''', ['patients']),
+    ('age_range', '''CASE
+        WHEN {row}.age < 30 THEN '18-29'
+        WHEN {row}.age < 40 THEN '30-39'
+        WHEN {row}.age < 50 THEN '40-49'
+        WHEN {row}.age < 60 THEN '50-59'
+        WHEN {row}.age < 70 THEN '60-69'
+        WHEN {row}.age < 80 THEN '70-79'
+        ELSE '80+'
+    END''', ['patients']),
+    ('risk_by_age', '''CASE
+        WHEN {row}.age < 40 THEN '<40'
+        WHEN {row}.age < 50 THEN '40-49'
+        WHEN {row}.age < 60 THEN '50-59'
+        WHEN {row}.age < 70 THEN '60-69'
+        WHEN {row}.age < 80 THEN '70-79'
+        ELSE '80+'
+    END''', ['patients', 'risk_count', 'risk_sum']),
+    ('diagnosis', '{row}.diagnosis', ['patients']),
+    ('admission_day', "COALESCE(DATE({row}.admission_date), '')", ['patients'])
+]
+
+def _dashboard_apply(row, sign, dimensions=DASHBOARD_DIMENSIONS):
+    """Trigger body adding (sign=1) or removing (sign=-1) one patients row"""
+    statements = []
+    for dimension, bucket, measures in dimensions:
+        bucket = bucket.format(row=row)
+        values = ', '.join(f'{sign} * ({DASHBOARD_MEASURES[measure].format(row=row)})' for measure in measures)
+        updates = ', '.join(f'{measure} = {measure} + excluded.{measure}' for measure in measures)
+        statements.append(f'''
+            INSERT INTO dashboard_aggregates (dimension, bucket, {', '.join(measures)})
+            VALUES ('{dimension}', {bucket}, {values})
+            ON CONFLICT (dimension, bucket) DO UPDATE SET {updates};
+        ''')
+        if sign < 0:
+            statements.append(f'''
+                DELETE FROM dashboard_aggregates
+                WHERE dimension = '{dimension}' AND bucket = {bucket} AND patients = 0;
+            ''')
+    return ''.join(statements)
+
+def _dashboard_update_trigger(dimension):
+    """Trigger moving a row between one dimension's buckets when its inputs change
+    
+    One trigger per dimension, so e.g. rescoring only touches the dimensions
+    that depend on risk_score / risk_level.
+    """
+    name, bucket, measures = dimension
+    expressions = ' '.join([bucket] + [DASHBOARD_MEASURES[measure] for measure in measures])
+    columns = sorted(set(re.findall(r'\{row\}\.(\w+)', expressions)))
+    changed = ' OR '.join(f'OLD.{column} IS NOT NEW.{column}' for column in columns)
+    return f'''
+        CREATE TRIGGER IF NOT EXISTS dashboard_{name}_updated
+        AFTER UPDATE OF {', '.join(columns)} ON patients
+        WHEN {changed}
+        BEGIN
+            {_dashboard_apply('OLD', -1, [dimension])}
+            {_dashboard_apply('NEW', 1, [dimension])}
+        END
+    '''
+
+def _dashboard_backfill():
+    """Statements recomputing dashboard_aggregates from the patients table"""
+    statements = ['DELETE FROM dashboard_aggregates']
+    for dimension, bucket, measures in DASHBOARD_DIMENSIONS:
+        sums = ', '.join(f'SUM({DASHBOARD_MEASURES[measure].format(row="patients")})' for measure in measures)
+        statements.append(f'''
+            INSERT INTO dashboard_aggregates (dimension, bucket, {', '.join(measures)})
+            SELECT '{dimension}', {bucket.format(row="patients")}, {sums}
+            FROM patients
+            GROUP BY 2
+        ''')
+    return statements
+
+# Schema migrations, applied in order on top of the base schema.
+# PRAGMA user_version records how many of them a database has already run.
+MIGRATIONS = [
+    # Incremental rescoring: a patient needs rescoring when risk_model_version
+    # is NULL (new row or changed inputs) or differs from the active model
+    [
+        'ALTER TABLE patients ADD COLUMN risk_model_version TEXT',
+        '''
+            CREATE TRIGGER IF NOT EXISTS patients_inputs_changed
+            AFTER UPDATE OF age, admission_date, discharge_date, diagnosis,
+                            previous_admissions, comorbidities ON patients
+            BEGIN
+                UPDATE patients SET risk_model_version = NULL WHERE id = NEW.id;
+            END
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS vitals_inserted
+            AFTER INSERT ON vitals
+            BEGIN
+                UPDATE patients SET risk_model_version = NULL WHERE patient_id = NEW.patient_id;
+            END
+        '''
+    ],
+    # Background jobs (see models.jobs), shared by all workers
+    [
+        '''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                job_type TEXT NOT NULL,
+                status TEXT NOT NULL,
+                progress_current INTEGER DEFAULT 0,
+                progress_total INTEGER,
+                result TEXT,
+                error TEXT,
+                worker_pid INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        '''
+    ],
+    # Indexes for the real access paths (see HOT_QUERIES / audit_query_plans)
+    [
+        'CREATE INDEX IF NOT EXISTS idx_vitals_patient_id ON vitals(patient_id)',
+        'CREATE INDEX IF NOT EXISTS idx_notes_patient_created ON notes(patient_id, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_patients_risk_score ON patients(risk_score)',
+        'CREATE INDEX IF NOT EXISTS idx_patients_admission_date ON patients(admission_date)',
+        'CREATE INDEX IF NOT EXISTS idx_patients_name ON patients(name)',
+        'CREATE INDEX IF NOT EXISTS idx_patients_level_score ON patients(risk_level, risk_score)',
+        'CREATE INDEX IF NOT EXISTS idx_patients_level_admission ON patients(risk_level, admission_date)',
+        'CREATE INDEX IF NOT EXISTS idx_patients_level_name ON patients(risk_level, name)',
+        'PRAGMA optimize'
+    ],
+    # latest_vitals keeps the most recent vitals row per patient so joins
+    # never fan out when a patient has several vitals rows
+    [
+        '''
+            CREATE TABLE IF NOT EXISTS latest_vitals (
+                patient_id TEXT PRIMARY KEY,
+                vitals_id INTEGER NOT NULL,
+                heart_rate INTEGER,
+                blood_pressure_systolic INTEGER,
+                blood_pressure_diastolic INTEGER,
+                temperature REAL,
+                oxygen_saturation INTEGER,
+                recorded_at TIMESTAMP
+            )
+        ''',
+        '''
+            INSERT OR REPLACE INTO latest_vitals
+            SELECT patient_id, id, heart_rate, blood_pressure_systolic, blood_pressure_diastolic,
+                   temperature, oxygen_saturation, recorded_at
+            FROM vitals
+            WHERE id IN (SELECT MAX(id) FROM vitals GROUP BY patient_id)
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS latest_vitals_on_insert
+            AFTER INSERT ON vitals
+            BEGIN
+                INSERT OR REPLACE INTO latest_vitals
+                VALUES (NEW.patient_id, NEW.id, NEW.heart_rate, NEW.blood_pressure_systolic,
+                        NEW.blood_pressure_diastolic, NEW.temperature, NEW.oxygen_saturation,
+                        NEW.recorded_at);
+            END
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS latest_vitals_on_delete
+            AFTER DELETE ON vitals
+            BEGIN
+                DELETE FROM latest_vitals WHERE patient_id = OLD.patient_id AND vitals_id = OLD.id;
+                INSERT OR IGNORE INTO latest_vitals
+                SELECT patient_id, id, heart_rate, blood_pressure_systolic, blood_pressure_diastolic,
+                       temperature, oxygen_saturation, recorded_at
+                FROM vitals
+                WHERE patient_id = OLD.patient_id
+                ORDER BY id DESC
+                LIMIT 1;
+            END
+        '''
+    ],
+    # Single-row counter bumped by every write that changes dashboard data,
+    # so per-worker caches can tell when they are stale
+    [
+        '''
+            CREATE TABLE IF NOT EXISTS data_generation (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                generation INTEGER NOT NULL
+            )
+        ''',
+        'INSERT OR IGNORE INTO data_generation (id, generation) VALUES (1, 0)'
+    ],
+    # Dashboard counts and running sums per bucket, kept current by triggers
+    # so the dashboard reads O(buckets) rows instead of scanning patients
+    [
+        f'''
+            CREATE TABLE IF NOT EXISTS dashboard_aggregates (
+                dimension TEXT NOT NULL,
+                bucket TEXT NOT NULL,
+                {', '.join(f'{measure} REAL NOT NULL DEFAULT 0' for measure in DASHBOARD_MEASURES)},
+                PRIMARY KEY (dimension, bucket)
+            )
+        ''',
+        *_dashboard_backfill(),
+        f'''
+            CREATE TRIGGER IF NOT EXISTS dashboard_patient_inserted
+            AFTER INSERT ON patients
+            BEGIN
+                {_dashboard_apply('NEW', 1)}
+            END
+        ''',
+        f'''
+            CREATE TRIGGER IF NOT EXISTS dashboard_patient_deleted
+            AFTER DELETE ON patients
+            BEGIN
+                {_dashboard_apply('OLD', -1)}
+            END
+        ''',
+        *[_dashboard_update_trigger(dimension) for dimension in DASHBOARD_DIMENSIONS]
+    ],
+    # Stored note analyses (see ml.note_entities): per note, plus a cache of
+    # results by text so identical notes and repeat requests are analyzed once
+    [
+        'ALTER TABLE notes ADD COLUMN content_hash TEXT',
+        'ALTER TABLE notes ADD COLUMN analyzer_version TEXT',
+        '''
+            CREATE TABLE IF NOT EXISTS note_analyses (
+                content_hash TEXT NOT NULL,
+                analyzer_version TEXT NOT NULL,
+                result TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (content_hash, analyzer_version)
+            )
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS notes_text_changed
+            AFTER UPDATE OF note_text ON notes
+            BEGIN
+                UPDATE notes SET extracted_entities = NULL, content_hash = NULL, analyzer_version = NULL
+                WHERE id = NEW.id;
+            END
+        '''
+    ],
+    # Explanation payload (top factors, recommendations, ...) stored by
+    # rescoring next to the score, so reads never call the model (see
+    # ml.scoring.stored_prediction). Existing scores are marked out of date
+    # so the next rescore fills it in.
+    [
+        '''
+            CREATE TABLE IF NOT EXISTS risk_explanations (
+                patient_id TEXT PRIMARY KEY,
+                model_version TEXT NOT NULL,
+                payload TEXT NOT NULL
+            )
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS risk_explanations_patient_deleted
+            AFTER DELETE ON patients
+            BEGIN
+                DELETE FROM risk_explanations WHERE patient_id = OLD.patient_id;
+            END
+        ''',
+        'UPDATE patients SET risk_model_version = NULL'
+    ],
+    # Lets ml.note_entities.prune_note_analyses find stored analyses no note uses
+    [
+        'CREATE INDEX IF NOT EXISTS idx_notes_content_hash ON notes(content_hash)'
+    ]
+]
+
+# How long a starting worker waits for another one's migration to finish
+MIGRATION_LOCK_TIMEOUT_MS = 60000
+
+# Queries on request paths that must always be served from an index
+HOT_QUERIES = {
+    # First pages as get_patients (routes/patients.py) builds them
+    'patients_by_risk': (PATIENTS_WITH_VITALS + '''
+        WHERE 1=1 ORDER BY p.risk_score DESC, p.id DESC LIMIT ?
+    ''', (100,)),
+    'patients_by_date': (PATIENTS_WITH_VITALS + '''
+        WHERE 1=1 ORDER BY p.admission_date DESC, p.id DESC LIMIT ?
+    ''', (100,)),
+    'patients_by_name': (PATIENTS_WITH_VITALS + '''
+        WHERE 1=1 ORDER BY p.name ASC, p.id ASC LIMIT ?
+    ''', (100,)),
+    'patients_by_level_and_risk': (PATIENTS_WITH_VITALS + '''
+        WHERE 1=1 AND p.risk_level = ? ORDER BY p.risk_score DESC, p.id DESC LIMIT ?
+    ''', ('high', 100)),
+    'patients_by_level_and_date': (PATIENTS_WITH_VITALS + '''
+        WHERE 1=1 AND p.risk_level = ? ORDER BY p.admission_date DESC, p.id DESC LIMIT ?
+    ''', ('high', 100)),
+    'patients_by_level_and_name': (PATIENTS_WITH_VITALS + '''
+        WHERE 1=1 AND p.risk_level = ? ORDER BY p.name ASC, p.id ASC LIMIT ?
+    ''', ('high', 100)),
+    # Cursor pages as get_patients (routes/patients.py) builds them
+    'patients_page_after_cursor': (PATIENTS_WITH_VITALS + '''
+        WHERE 1=1 AND (p.risk_score, p.id) < (?, ?)
+        ORDER BY p.risk_score DESC, p.id DESC LIMIT ?
+    ''', (50.0, 100, 100)),
+    'patients_page_after_cursor_by_level': (PATIENTS_WITH_VITALS + '''
+        WHERE 1=1 AND p.risk_level = ? AND (p.risk_score, p.id) < (?, ?)
+        ORDER BY p.risk_score DESC, p.id DESC LIMIT ?
+    ''', ('high', 50.0, 100, 100)),
+    'patients_page_after_cursor_by_date': (PATIENTS_WITH_VITALS + '''
+        WHERE 1=1 AND p.risk_level = ? AND (p.admission_date, p.id) < (?, ?)
+        ORDER BY p.admission_date DESC, p.id DESC LIMIT ?
+    ''', ('high', '2024-10-15', 100, 100)),
+    'patients_page_null_risk_tail': (PATIENTS_WITH_VITALS + '''
+        WHERE 1=1 AND p.risk_score IS NULL AND p.id < ?
+        ORDER BY p.risk_score DESC, p.id DESC LIMIT ?
+    ''', (100, 100)),
+    'patients_page_next_cursor': ('''
+        SELECT p.risk_score, p.id FROM patients p
+        WHERE 1=1 AND (p.risk_score, p.id) < (?, ?)
+        ORDER BY p.risk_score DESC, p.id DESC LIMIT 2 OFFSET ?
+    ''', (50.0, 100, 99)),
+    'patient_detail': ('''
+        SELECT p.*, v.heart_rate FROM patients p
+        LEFT JOIN latest_vitals v ON p.patient_id = v.patient_id
+        WHERE p.patient_id = ?
+    ''', ('P00001',)),
+    'patient_notes': (
+        'SELECT * FROM notes WHERE patient_id = ? ORDER BY created_at DESC', ('P00001',)
+    ),
+    'risk_explanation': (
+        'SELECT payload FROM risk_explanations WHERE patient_id = ? AND model_version = ?',
+        ('P00001', 'rule-based')
+    ),
+    'delete_patient_vitals': ('DELETE FROM vitals WHERE patient_id = ?', ('P00001',)),
+    'delete_patient_notes': ('DELETE FROM notes WHERE patient_id = ?', ('P00001',))
+}
+
+# First pages, which walk the ORDER BY index and stop after LIMIT rows
+ORDERED_SCAN_QUERIES = {'patients_by_risk', 'patients_by_date', 'patients_by_name'}
+
+# Applied once to every new connection
+CONNECTION_PRAGMAS = [
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA cache_size = -65536',     # 64MB page cache
+    'PRAGMA mmap_size = 268435456',   # 256MB memory-mapped I/O
+    'PRAGMA recursive_triggers = ON'  # INSERT OR REPLACE fires delete triggers
+]
+
+# One long-lived connection per thread (gunicorn threads, job threads)
+_pool = threading.local()
+
 def get_db_connection():
-    """Create and return a database connection"""
+    """Create and return a new database connection (caller closes it)"""
     conn = sqlite3.connect(DATABASE_PATH)
     conn.row_factory = sqlite3.Row
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
     return conn
 
+def get_pooled_connection():
+    """Return this thread's reusable connection, opening it on first use
+    
+    Connections are thread-affine and never closed by callers. A forked
+    process (e.g. a gunicorn worker) opens its own instead of reusing one
+    inherited from its parent.
+    """
+    key = (os.getpid(), DATABASE_PATH)
+    if getattr(_pool, 'key', None) != key:
+        _pool.conn = get_db_connection()
+        _pool.key = key
+    return _pool.conn
+
+def get_db():
+    """Return the pooled connection bound to the current app context"""
+    if 'db' not in g:
+        g.db = get_pooled_connection()
+    return g.db
+
+def release_db(exception=None):
+    """Hand the request's connection back to the pool with no open transaction"""
+    conn = g.pop('db', None)
+    if conn is not None and conn.in_transaction:
+        conn.rollback()
+
+def init_app(app):
+    """Release pooled connections at the end of every request"""
+    app.teardown_appcontext(release_db)
+
+def get_data_generation(conn):
+    """Current data generation; changes whenever patient data is written"""
+    return conn.execute('SELECT generation FROM data_generation WHERE id = 1').fetchone()[0]
+
+def bump_data_generation(conn):
+    """Invalidate caches derived from patient data (call after committing writes)"""
+    conn.execute('UPDATE data_generation SET generation = generation + 1 WHERE id = 1')
+    conn.commit()
+
+def rebuild_dashboard_aggregates(conn):
+    """Recompute dashboard_aggregates from the patients table
+    
+    The triggers keep it current for writes made through get_db_connection;
+    this repairs it after bulk edits from other tools.
+    """
+    for statement in _dashboard_backfill():
+        conn.execute(statement)
+    conn.commit()
+    bump_data_generation(conn)
+
 def init_database():
     """Initialize database with schema"""
     conn = get_db_connection()
@@ -61,8 +497,77 @@ def init_database():
     ''')
     
     conn.commit()
+    migrate_database(conn)
     conn.close()
     print("✅ Database initialized successfully")
 
+def migrate_database(conn):
+    """Apply any schema migrations the database has not run yet
+    
+    Each migration and its user_version bump run in one BEGIN IMMEDIATE
+    transaction, so a crash never leaves one half applied, and workers
+    starting together take turns: user_version is re-read under the write
+    lock and a migration another worker already ran is skipped.
+    """
+    conn.commit()
+    conn.execute(f'PRAGMA busy_timeout = {MIGRATION_LOCK_TIMEOUT_MS}')
+    
+    while True:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            applied = conn.execute('PRAGMA user_version').fetchone()[0]
+            if applied >= len(MIGRATIONS):
+                conn.rollback()
+                return
+            
+            for statement in MIGRATIONS[applied]:
+                conn.execute(statement)
+            conn.execute(f'PRAGMA user_version = {applied + 1}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+def audit_query_plans(conn, queries=None, ordered_scans=ORDERED_SCAN_QUERIES):
+    """Run EXPLAIN QUERY PLAN over queries (default HOT_QUERIES) and return every step that is not an index search
+    
+    queries maps names to (sql, params). Returns a list of (query name,
+    plan detail) pairs; empty means every query seeks into an index. A
+    SCAN, even "SCAN t USING INDEX", reads a whole table or index and
+    fails, except in ordered_scans where it walks the ORDER BY index and
+    stops at the LIMIT; those fail instead if they sort in a temp b-tree,
+    which reads every row first. Scans of a subquery's rows are not table
+    reads and pass.
+    """
+    failures = []
+    for name, (query, params) in (HOT_QUERIES if queries is None else queries).items():
+        for row in conn.execute(f'EXPLAIN QUERY PLAN {query}', params):
+            detail = row['detail']
+            if detail.startswith('SCAN (subquery'):
+                continue
+            if name in ordered_scans:
+                if (detail.startswith('SCAN') and 'USING' not in detail) or 'TEMP B-TREE' in detail:
+                    failures.append((name, detail))
+            elif detail.startswith('SCAN'):
+                failures.append((name, detail))
+    return failures
+
 if __name__ == '__main__':
     init_database()
+    
+    if '--rebuild-aggregates' in sys.argv:
+        conn = get_db_connection()
+        rebuild_dashboard_aggregates(conn)
+        conn.close()
+        print("✅ Dashboard aggregates rebuilt")
+    
+    if '--audit' in sys.argv:
+        conn = get_db_connection()
+        failures = audit_query_plans(conn)
+        conn.close()
+        
+        for name, detail in failures:
+            print(f"❌ {name}: {detail}")
+        if failures:
+            sys.exit(1)
+        print(f"✅ All {len(HOT_QUERIES)} hot queries seek an index or stop at their LIMIT")
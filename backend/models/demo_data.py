@@ -7,9 +7,9 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 try:
-    from models.database import get_db_connection, init_database
+    from models.database import get_db_connection, init_database, bump_data_generation
 except ImportError:
-    from database import get_db_connection, init_database
+    from database import get_db_connection, init_database, bump_data_generation
 
 # Sample data pools
 FIRST_NAMES = ['John', 'Mary', 'James', 'Patricia', 'Robert', 'Jennifer', 'Michael', 'Linda', 
@@ -106,35 +106,29 @@ def generate_demo_data(num_patients=50):
             ''', (patient_id, note_text))
     
     conn.commit()
+    bump_data_generation(conn)
     
     # Calculate risk scores for all patients
     print("Calculating risk scores...")
     try:
-        from ml.risk_predictor import predictor
+        from ml.scoring import rescore_patients
         
-        cursor.execute('''
-            SELECT p.*, v.heart_rate, v.blood_pressure_systolic, v.blood_pressure_diastolic,
-                   v.temperature, v.oxygen_saturation
-            FROM patients p
-            LEFT JOIN vitals v ON p.patient_id = v.patient_id
-        ''')
-        
-        patients = cursor.fetchall()
-        for patient in patients:
-            patient_dict = dict(patient)
-            prediction = predictor.predict(patient_dict)
-            
-            cursor.execute('''
-                UPDATE patients 
-                SET risk_score = ?, risk_level = ?
-                WHERE patient_id = ?
-            ''', (prediction['riskScore'], prediction['riskLevel'], patient_dict['patient_id']))
-        
-        conn.commit()
-        print(f"✅ Calculated risk scores for {len(patients)} patients")
+        scored = rescore_patients(conn)
+        print(f"✅ Calculated risk scores for {scored} patients")
     except Exception as e:
         print(f"⚠️  Could not calculate risk scores: {e}")
     
+    # Store the notes' extracted entities now, so viewing a patient never runs spaCy
+    print("Extracting note entities...")
+    try:
+        from ml.note_entities import backfill_note_entities, prune_note_analyses
+        
+        analyzed = backfill_note_entities(conn)
+        prune_note_analyses(conn)
+        print(f"✅ Extracted entities from {analyzed} notes")
+    except Exception as e:
+        print(f"⚠️  Could not extract note entities: {e}")
+    
     conn.close()
     print(f"✅ Generated {num_patients} patients with vitals and notes")
 
@@ -0,0 +1,105 @@
+import csv
+
+from models.database import bump_data_generation
+
+# CSV rows inserted per executemany batch (and per commit) during upload
+INGEST_BATCH_SIZE = 1000
+
+# Row-level errors kept in the upload report; the rest are only counted
+MAX_REPORTED_ERRORS = 100
+
+REQUIRED_FIELDS = ['patient_id', 'name', 'admission_date', 'diagnosis']
+
+def _patient_values(row):
+    for field in REQUIRED_FIELDS:
+        if not row.get(field):
+            raise ValueError(f'Missing required field: {field}')
+    
+    return (
+        row.get('patient_id'),
+        row.get('name'),
+        int(row.get('age', 0)),
+        row.get('gender'),
+        row.get('admission_date'),
+        row.get('diagnosis'),
+        int(row.get('previous_admissions', 0)),
+        int(row.get('comorbidities', 0))
+    )
+
+def _vitals_values(row):
+    return (
+        row.get('patient_id'),
+        int(row.get('heart_rate', 75)),
+        int(row.get('blood_pressure_systolic', 120)),
+        int(row.get('blood_pressure_diastolic', 80)),
+        float(row.get('temperature', 37.0)),
+        int(row.get('oxygen_saturation', 98))
+    )
+
+def _flush(conn, patients, vitals):
+    cursor = conn.cursor()
+    cursor.executemany('''
+        INSERT OR REPLACE INTO patients
+        (patient_id, name, age, gender, admission_date, diagnosis, previous_admissions, comorbidities)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', patients)
+    cursor.executemany('''
+        INSERT INTO vitals
+        (patient_id, heart_rate, blood_pressure_systolic, blood_pressure_diastolic, temperature, oxygen_saturation)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', vitals)
+    conn.commit()
+
+def ingest_patients_csv(conn, text_stream, batch_size=INGEST_BATCH_SIZE, progress=None):
+    """Stream patient rows from a CSV text stream into the database
+    
+    Rows are parsed one at a time and inserted with executemany in batches
+    of batch_size, committing per batch, so memory stays flat regardless of
+    file size. Invalid rows are skipped and reported instead of aborting
+    the whole upload. progress(records_processed) is called per batch.
+    """
+    csv_reader = csv.DictReader(text_stream)
+    has_vitals = 'heart_rate' in (csv_reader.fieldnames or [])
+    
+    report = {
+        'recordsProcessed': 0,
+        'recordsFailed': 0,
+        'batchesCommitted': 0,
+        'errors': []
+    }
+    patients = []
+    vitals = []
+    
+    for row in csv_reader:
+        try:
+            patient = _patient_values(row)
+            vital = _vitals_values(row) if has_vitals else None
+        except (TypeError, ValueError) as e:
+            report['recordsFailed'] += 1
+            if len(report['errors']) < MAX_REPORTED_ERRORS:
+                report['errors'].append({'line': csv_reader.line_num, 'error': str(e)})
+            continue
+        
+        patients.append(patient)
+        if vital:
+            vitals.append(vital)
+        
+        if len(patients) >= batch_size:
+            _flush(conn, patients, vitals)
+            report['recordsProcessed'] += len(patients)
+            report['batchesCommitted'] += 1
+            patients = []
+            vitals = []
+            if progress:
+                progress(report['recordsProcessed'])
+    
+    if patients:
+        _flush(conn, patients, vitals)
+        report['recordsProcessed'] += len(patients)
+        report['batchesCommitted'] += 1
+        if progress:
+            progress(report['recordsProcessed'])
+    
+    if report['recordsProcessed']:
+        bump_data_generation(conn)
+    return report
@@ -0,0 +1,170 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from models.database import get_db_connection, get_pooled_connection
+
+# Background threads per worker process for long-running bulk operations
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+
+# Seconds between updated_at heartbeats of this worker's queued/running jobs
+JOB_HEARTBEAT_INTERVAL = float(os.environ.get('JOB_HEARTBEAT_INTERVAL', 30))
+
+# A queued/running job without a heartbeat for this long is treated as
+# interrupted, even if some process now holds its worker_pid
+JOB_STALE_SECONDS = float(os.environ.get('JOB_STALE_SECONDS', 120))
+
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='job')
+
+# Jobs queued or running in this process, kept alive by the heartbeat thread
+_active_jobs = set()
+_active_lock = threading.Lock()
+_heartbeat_pid = None
+
+def _ensure_heartbeat():
+    """Start this process's heartbeat thread (once per process, also after a fork)"""
+    global _heartbeat_pid
+    with _active_lock:
+        if _heartbeat_pid == os.getpid():
+            return
+        _heartbeat_pid = os.getpid()
+    threading.Thread(target=_heartbeat, name='job-heartbeat', daemon=True).start()
+
+def _heartbeat():
+    conn = get_db_connection()
+    while True:
+        time.sleep(JOB_HEARTBEAT_INTERVAL)
+        with _active_lock:
+            job_ids = [(job_id,) for job_id in _active_jobs]
+        if not job_ids:
+            continue
+        try:
+            conn.executemany('UPDATE jobs SET updated_at = CURRENT_TIMESTAMP WHERE id = ?', job_ids)
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"⚠️  Could not record job heartbeat: {e}")
+
+def submit_job(job_type, func, *args):
+    """Queue func(progress, *args) on the job pool and return the new job id
+    
+    Job state lives in the jobs table, so any worker can answer status
+    requests and results outlive the process that ran the job. func calls
+    progress(current, total) to report progress and returns a JSON-able
+    result.
+    """
+    job_id = uuid.uuid4().hex
+    
+    conn = get_pooled_connection()
+    conn.execute('''
+        INSERT INTO jobs (id, job_type, status, worker_pid)
+        VALUES (?, ?, 'queued', ?)
+    ''', (job_id, job_type, os.getpid()))
+    conn.commit()
+    
+    with _active_lock:
+        _active_jobs.add(job_id)
+    _ensure_heartbeat()
+    _executor.submit(_run_job, job_id, func, args)
+    return job_id
+
+def _run_job(job_id, func, args):
+    conn = get_db_connection()
+    
+    def update(**fields):
+        assignments = ', '.join(f'{column} = ?' for column in fields)
+        conn.execute(
+            f'UPDATE jobs SET {assignments}, updated_at = CURRENT_TIMESTAMP WHERE id = ?',
+            (*fields.values(), job_id)
+        )
+        conn.commit()
+    
+    def progress(current, total=None):
+        update(progress_current=current, progress_total=total)
+    
+    try:
+        update(status='running')
+        result = func(progress, *args)
+        update(status='succeeded', result=json.dumps(result))
+    except Exception as e:
+        traceback.print_exc()
+        update(status='failed', error=str(e))
+    finally:
+        with _active_lock:
+            _active_jobs.discard(job_id)
+        conn.close()
+
+def get_job(job_id):
+    """Return the API representation of a job, or None if it does not exist"""
+    conn = get_pooled_connection()
+    row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+    
+    if not row:
+        return None
+    
+    if row['status'] in ('queued', 'running') and recover_interrupted_jobs(job_id):
+        row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+    
+    return {
+        'jobId': row['id'],
+        'type': row['job_type'],
+        'status': row['status'],
+        'progress': {
+            'current': row['progress_current'],
+            'total': row['progress_total']
+        },
+        'result': json.loads(row['result']) if row['result'] else None,
+        'error': row['error'],
+        'createdAt': row['created_at'],
+        'updatedAt': row['updated_at']
+    }
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def recover_interrupted_jobs(job_id=None):
+    """Fail queued/running jobs whose worker is gone (all of them, or just job_id)
+    
+    A job counts as interrupted when its worker process no longer exists or
+    it has had no heartbeat for JOB_STALE_SECONDS; the heartbeat check
+    catches PIDs reused by an unrelated process, e.g. after a container
+    restart. Jobs queued or running in this process are never touched.
+    """
+    query = '''
+        SELECT id, worker_pid, updated_at < datetime('now', ?) AS stale
+        FROM jobs WHERE status IN ('queued', 'running')
+    '''
+    params = [f'-{JOB_STALE_SECONDS} seconds']
+    if job_id is not None:
+        query += ' AND id = ?'
+        params.append(job_id)
+    
+    conn = get_db_connection()
+    try:
+        rows = conn.execute(query, params).fetchall()
+        with _active_lock:
+            own_jobs = set(_active_jobs)
+        
+        interrupted = [
+            (row['id'],) for row in rows
+            if row['id'] not in own_jobs and (row['stale'] or not _process_alive(row['worker_pid']))
+        ]
+        conn.executemany('''
+            UPDATE jobs
+            SET status = 'failed', error = 'Interrupted by worker restart', updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status IN ('queued', 'running')
+        ''', interrupted)
+        conn.commit()
+    finally:
+        conn.close()
+    return len(interrupted)
@@ -0,0 +1,27 @@
+from flask import Blueprint, jsonify
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.jobs import get_job
+
+jobs_bp = Blueprint('jobs', __name__)
+
+@jobs_bp.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    """Get status, progress and result of a background job"""
+    job = get_job(job_id)
+    
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    return jsonify(job)
+
+def job_accepted(job_id):
+    """202 response for an endpoint that handed its work to a background job"""
+    return jsonify({
+        'success': True,
+        'jobId': job_id,
+        'status': 'queued',
+        'statusUrl': f'/api/jobs/{job_id}'
+    }), 202
@@ -3,7 +3,13 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from ml.nlp_analyzer import analyzer
+from models.database import get_db, get_db_connection
+from models.jobs import submit_job
+from ml.note_entities import cached_analyses, backfill_note_entities, prune_note_analyses
+from routes.jobs import job_accepted
+
+# Most notes accepted by one analyze-batch request
+MAX_BATCH_NOTES = int(os.environ.get('MAX_BATCH_NOTES', 1000))
 
 notes_bp = Blueprint('notes', __name__)
 
@@ -18,7 +24,52 @@ def analyze_note():
     note_text = data['noteText']
     
     try:
-        result = analyzer.analyze_note(note_text)
+        result = cached_analyses(get_db(), [note_text])[0]
         return jsonify(result)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+
+@notes_bp.route('/api/notes/analyze-batch', methods=['POST'])
+def analyze_notes():
+    """Analyze a batch of clinical notes in one spaCy pipeline pass"""
+    data = request.get_json()
+    
+    if not isinstance(data, dict) or not isinstance(data.get('notes'), list):
+        return jsonify({'error': 'No notes provided'}), 400
+    
+    notes = data['notes']
+    if len(notes) > MAX_BATCH_NOTES:
+        return jsonify({'error': f'At most {MAX_BATCH_NOTES} notes per request'}), 400
+    if not all(isinstance(note, str) for note in notes):
+        return jsonify({'error': 'Every note must be a string'}), 400
+    
+    try:
+        results = cached_analyses(get_db(), notes)
+        return jsonify({'results': results})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@notes_bp.route('/api/notes/backfill', methods=['POST'])
+def backfill_notes():
+    """Store extracted entities for every note not yet analyzed and prune unused ones (as a background job)"""
+    try:
+        job_id = submit_job('notes-backfill', _backfill_notes)
+        return job_accepted(job_id)
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _backfill_notes(progress):
+    """Background job: analyze and store entities for out-of-date notes, then prune unused analyses"""
+    conn = get_db_connection()
+    try:
+        analyzed = backfill_note_entities(conn, progress=progress)
+        pruned = prune_note_analyses(conn)
+    finally:
+        conn.close()
+    
+    return {
+        'success': True,
+        'notesAnalyzed': analyzed,
+        'analysesPruned': pruned
+    }
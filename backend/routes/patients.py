@@ -1,88 +1,228 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, request, stream_with_context
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from models.database import get_db_connection
+from models.database import get_db, get_db_connection, bump_data_generation, PATIENTS_WITH_VITALS
 from models.demo_data import generate_demo_data
-from ml.risk_predictor import predictor
-import csv
-import io
+from models.ingest import ingest_patients_csv
+from models.jobs import submit_job
+from ml.risk_predictor import predictor, resolve_candidates
+from ml.scoring import rescore_patients, stored_prediction
+from ml.note_entities import note_analyses, prune_note_analyses
+from routes.jobs import job_accepted
+import base64
+import json
+import tempfile
 
 patients_bp = Blueprint('patients', __name__)
 
+# sort parameter -> (column, direction); p.id breaks ties in the same direction
+SORT_ORDERS = {
+    'risk': ('p.risk_score', 'DESC'),
+    'date': ('p.admission_date', 'DESC'),
+    'name': ('p.name', 'ASC')
+}
+
+# Sort columns that can hold NULLs (unscored patients); the others are NOT NULL
+NULLABLE_SORT_COLUMNS = {'p.risk_score'}
+
+# Columns selectable with fields=
+PATIENT_FIELDS = [
+    'id', 'patient_id', 'name', 'age', 'gender', 'admission_date', 'discharge_date', 'diagnosis',
+    'previous_admissions', 'comorbidities', 'risk_score', 'risk_level', 'risk_model_version', 'created_at'
+]
+VITALS_FIELDS = [
+    'heart_rate', 'blood_pressure_systolic', 'blood_pressure_diastolic', 'temperature', 'oxygen_saturation'
+]
+
+# Rows pulled from SQLite per fetchmany while streaming a page
+STREAM_BATCH_SIZE = 500
+
+# Range of a SQLite INTEGER; cursor values outside it cannot be bound
+SQLITE_INT_MIN, SQLITE_INT_MAX = -2 ** 63, 2 ** 63 - 1
+
+def _encode_cursor(sort_value, row_id):
+    return base64.urlsafe_b64encode(json.dumps([sort_value, row_id]).encode()).decode()
+
+def _is_sqlite_int(value):
+    # bool is an int subclass but never a column value; larger ints overflow SQLite's binding
+    return isinstance(value, int) and not isinstance(value, bool) and SQLITE_INT_MIN <= value <= SQLITE_INT_MAX
+
+def _decode_cursor(cursor_param):
+    key = json.loads(base64.urlsafe_b64decode(cursor_param.encode()))
+    if not isinstance(key, list) or len(key) != 2:
+        raise ValueError('cursor is not a [sort value, id] pair')
+    sort_value, row_id = key
+    if not (sort_value is None or isinstance(sort_value, (str, float)) or _is_sqlite_int(sort_value)):
+        raise ValueError('cursor sort value is not a column value')
+    if not _is_sqlite_int(row_id):
+        raise ValueError('cursor id is not an integer')
+    return sort_value, row_id
+
+def _page_segments(sort_column, direction, cursor_key):
+    """(conditions, params) of the index ranges a page is read from, in order
+    
+    Every range is a single seek into the sort column's index. NULLs sort
+    last in DESC order, and a NULL-or-after predicate would turn the seek into
+    a walk from the top of the index, so after a non-NULL cursor on a
+    nullable column the NULL tail is read as a second range once the
+    non-NULL rows run out.
+    """
+    if cursor_key is None:
+        return [([], [])]
+    
+    sort_value, row_id = cursor_key
+    comparison = '<' if direction == 'DESC' else '>'
+    if sort_value is None:
+        return [([f'{sort_column} IS NULL', f'p.id {comparison} ?'], [row_id])]
+    
+    segments = [([f'({sort_column}, p.id) {comparison} (?, ?)'], [sort_value, row_id])]
+    if direction == 'DESC' and sort_column in NULLABLE_SORT_COLUMNS:
+        segments.append(([f'{sort_column} IS NULL'], []))
+    return segments
+
+def _next_cursor_key(conn, segments, sort_column, order_by, limit):
+    """Key of the page's last row if another row follows it, or None
+    
+    Walks the index only, so the cursor is known before streaming starts.
+    """
+    if limit <= 0:
+        return None
+    
+    remaining = limit
+    last_key = None
+    for where_clause, params in segments:
+        if last_key is not None:
+            # The page ended exactly at the end of the previous range
+            if conn.execute(f'SELECT 1 FROM patients p{where_clause} LIMIT 1', params).fetchone():
+                return last_key
+            continue
+        
+        keys = conn.execute(
+            f'SELECT {sort_column}, p.id FROM patients p{where_clause}{order_by} LIMIT 2 OFFSET ?',
+            params + [remaining - 1]
+        ).fetchall()
+        if len(keys) == 2:
+            return tuple(keys[0])
+        if len(keys) == 1:
+            last_key = tuple(keys[0])
+            continue
+        
+        # Range shorter than the rest of the page; the next one fills it
+        remaining -= conn.execute(
+            f'SELECT COUNT(*) FROM (SELECT 1 FROM patients p{where_clause} LIMIT ?)', params + [remaining]
+        ).fetchone()[0]
+    return None
+
 @patients_bp.route('/api/patients', methods=['GET'])
 def get_patients():
-    """Get all patients with optional filtering and sorting"""
+    """Get patients with optional filtering, sorting, keyset pagination and field projection
+    
+    Pass the X-Next-Cursor response header back as cursor= to fetch the next
+    page. The page is streamed as a JSON array, so memory use does not grow
+    with limit.
+    """
     risk_filter = request.args.get('risk')
     sort_by = request.args.get('sort', 'risk')
     limit = request.args.get('limit', 100, type=int)
+    cursor_param = request.args.get('cursor')
+    fields_param = request.args.get('fields')
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    sort_column, direction = SORT_ORDERS.get(sort_by, ('p.id', 'ASC'))
+    order_by = f' ORDER BY {sort_column} {direction}, p.id {direction}'
+    
+    # Projection; vitals are only joined when a vitals field is requested
+    if fields_param:
+        fields = [field.strip() for field in fields_param.split(',') if field.strip()]
+        unknown = [field for field in fields if field not in PATIENT_FIELDS + VITALS_FIELDS]
+        if unknown:
+            return jsonify({'error': f"Unknown fields: {', '.join(unknown)}"}), 400
+        
+        columns = [f'v.{field}' if field in VITALS_FIELDS else f'p.{field}' for field in fields]
+        query = f"SELECT {', '.join(columns)} FROM patients p"
+        if any(field in VITALS_FIELDS for field in fields):
+            query += ' LEFT JOIN latest_vitals v ON p.patient_id = v.patient_id'
+    else:
+        query = PATIENTS_WITH_VITALS
     
-    # Build query
-    query = '''
-        SELECT p.*, v.heart_rate, v.blood_pressure_systolic, v.blood_pressure_diastolic,
-               v.temperature, v.oxygen_saturation
-        FROM patients p
-        LEFT JOIN vitals v ON p.patient_id = v.patient_id
-        WHERE 1=1
-    '''
+    where = ['1=1']
     params = []
     
     if risk_filter:
-        query += ' AND p.risk_level = ?'
+        where.append('p.risk_level = ?')
         params.append(risk_filter)
     
-    # Add sorting
-    if sort_by == 'risk':
-        query += ' ORDER BY p.risk_score DESC'
-    elif sort_by == 'date':
-        query += ' ORDER BY p.admission_date DESC'
-    elif sort_by == 'name':
-        query += ' ORDER BY p.name ASC'
+    cursor_key = None
+    if cursor_param:
+        try:
+            cursor_key = _decode_cursor(cursor_param)
+        except (ValueError, TypeError):
+            return jsonify({'error': 'Invalid cursor'}), 400
     
-    query += f' LIMIT {limit}'
+    segments = [
+        (' WHERE ' + ' AND '.join(where + conditions), params + condition_params)
+        for conditions, condition_params in _page_segments(sort_column, direction, cursor_key)
+    ]
+    conn = get_db()
     
-    cursor.execute(query, params)
-    rows = cursor.fetchall()
+    headers = {}
+    next_key = _next_cursor_key(conn, segments, sort_column, order_by, limit)
+    if next_key is not None:
+        headers['X-Next-Cursor'] = _encode_cursor(*next_key)
     
-    patients = []
-    for row in rows:
-        patient = dict(row)
-        patients.append(patient)
+    def page_rows():
+        remaining = limit
+        for where_clause, segment_params in segments:
+            if 0 <= limit and remaining <= 0:
+                break
+            cursor = conn.execute(query + where_clause + order_by + ' LIMIT ?', segment_params + [remaining])
+            while True:
+                rows = cursor.fetchmany(STREAM_BATCH_SIZE)
+                if not rows:
+                    break
+                remaining -= len(rows)
+                yield from rows
     
-    conn.close()
-    return jsonify(patients)
+    def generate():
+        yield '['
+        first = True
+        for row in page_rows():
+            yield ('' if first else ',') + json.dumps(dict(row))
+            first = False
+        yield ']'
+    
+    return Response(stream_with_context(generate()), mimetype='application/json', headers=headers)
 
 @patients_bp.route('/api/patients/<patient_id>', methods=['GET'])
 def get_patient(patient_id):
     """Get detailed patient information"""
-    conn = get_db_connection()
+    conn = get_db()
     cursor = conn.cursor()
     
-    cursor.execute('''
-        SELECT p.*, v.heart_rate, v.blood_pressure_systolic, v.blood_pressure_diastolic,
-               v.temperature, v.oxygen_saturation
-        FROM patients p
-        LEFT JOIN vitals v ON p.patient_id = v.patient_id
-        WHERE p.patient_id = ?
-    ''', (patient_id,))
+    cursor.execute(PATIENTS_WITH_VITALS + ' WHERE p.patient_id = ?', (patient_id,))
     
     row = cursor.fetchone()
     if not row:
-        conn.close()
         return jsonify({'error': 'Patient not found'}), 404
     
     patient = dict(row)
     
+    # Explanation stored with the score; None until the patient is rescored
+    # (for a still-admitted patient, rescored today)
+    patient['riskExplanation'] = stored_prediction(conn, row)
+    
     # Get notes
     cursor.execute('SELECT * FROM notes WHERE patient_id = ? ORDER BY created_at DESC', (patient_id,))
     notes = [dict(note) for note in cursor.fetchall()]
+    
+    # Stored entities; notes never analyzed by this analyzer version are
+    # processed in memory and left for the backfill to store
+    analyses = note_analyses(conn, notes, store=False)
+    for note in notes:
+        note['extracted_entities'] = analyses[note['id']]
     patient['notes'] = notes
     
-    conn.close()
     return jsonify(patient)
 
 @patients_bp.route('/api/data/upload', methods=['POST', 'OPTIONS'])
@@ -110,77 +250,17 @@ def upload_data():
         return jsonify({'error': 'File must be CSV format'}), 400
     
     try:
-        # Read CSV
-        stream = io.StringIO(file.stream.read().decode("UTF8"), newline=None)
-        csv_reader = csv.DictReader(stream)
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        records_processed = 0
-        for row in csv_reader:
-            # Insert patient
-            cursor.execute('''
-                INSERT OR REPLACE INTO patients 
-                (patient_id, name, age, gender, admission_date, diagnosis, previous_admissions, comorbidities)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                row.get('patient_id'),
-                row.get('name'),
-                int(row.get('age', 0)),
-                row.get('gender'),
-                row.get('admission_date'),
-                row.get('diagnosis'),
-                int(row.get('previous_admissions', 0)),
-                int(row.get('comorbidities', 0))
-            ))
-            
-            # Insert vitals if provided
-            if 'heart_rate' in row:
-                cursor.execute('''
-                    INSERT INTO vitals 
-                    (patient_id, heart_rate, blood_pressure_systolic, blood_pressure_diastolic, temperature, oxygen_saturation)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', (
-                    row.get('patient_id'),
-                    int(row.get('heart_rate', 75)),
-                    int(row.get('blood_pressure_systolic', 120)),
-                    int(row.get('blood_pressure_diastolic', 80)),
-                    float(row.get('temperature', 37.0)),
-                    int(row.get('oxygen_saturation', 98))
-                ))
-            
-            records_processed += 1
-        
-        conn.commit()
-        
-        # Calculate risk scores for uploaded patients
-        cursor.execute('''
-            SELECT p.*, v.heart_rate, v.blood_pressure_systolic, v.blood_pressure_diastolic,
-                   v.temperature, v.oxygen_saturation
-            FROM patients p
-            LEFT JOIN vitals v ON p.patient_id = v.patient_id
-        ''')
-        
-        patients = cursor.fetchall()
-        for patient in patients:
-            patient_dict = dict(patient)
-            prediction = predictor.predict(patient_dict)
-            
-            cursor.execute('''
-                UPDATE patients 
-                SET risk_score = ?, risk_level = ?
-                WHERE patient_id = ?
-            ''', (prediction['riskScore'], prediction['riskLevel'], patient_dict['patient_id']))
-        
-        conn.commit()
-        conn.close()
-        
-        return jsonify({
-            'success': True,
-            'recordsProcessed': records_processed,
-            'message': f'Uploaded {records_processed} patients and calculated risk scores'
-        })
+        # Spool the upload to disk; the job streams it from there in batches
+        fd, upload_path = tempfile.mkstemp(suffix='.csv')
+        os.close(fd)
+        try:
+            file.save(upload_path)
+            job_id = submit_job('upload', _ingest_upload, upload_path)
+        except Exception:
+            # The job removes the file once it runs; nothing will if it was never queued
+            os.remove(upload_path)
+            raise
+        return job_accepted(job_id)
     
     except Exception as e:
         print(f"Upload error: {str(e)}")
@@ -188,49 +268,92 @@ def upload_data():
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+def _ingest_upload(progress, upload_path):
+    """Background job: ingest an uploaded CSV and score the new patients"""
+    conn = get_db_connection()
+    try:
+        with open(upload_path, encoding='utf-8-sig', newline='') as stream:
+            report = ingest_patients_csv(conn, stream, progress=progress)
+        
+        # Calculate risk scores for uploaded patients (and anyone else out of date)
+        rescore_patients(conn)
+    finally:
+        conn.close()
+        os.remove(upload_path)
+    
+    records_processed = report['recordsProcessed']
+    return {
+        'success': True,
+        'recordsProcessed': records_processed,
+        'recordsFailed': report['recordsFailed'],
+        'batchesCommitted': report['batchesCommitted'],
+        'errors': report['errors'],
+        'message': f'Uploaded {records_processed} patients and calculated risk scores'
+    }
+
 @patients_bp.route('/api/ml/train', methods=['POST'])
 def train_ml_model():
-    """Train multiple ML models and compare performance"""
+    """Train multiple ML models and compare performance (as a background job)
+    
+    Optional JSON body: {"candidates": {"Random Forest": {"n_estimators": 300}, ...}}
+    to search a subset of the candidate models with pinned hyperparameters, and
+    "timeBudget" (seconds) to cap the hyperparameter search.
+    """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        data = request.get_json(silent=True) or {}
+        candidates = data.get('candidates')
+        time_budget = data.get('timeBudget')
+        try:
+            resolve_candidates(candidates)
+            if time_budget is not None:
+                time_budget = float(time_budget)
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': str(e)}), 400
         
-        cursor.execute('''
-            SELECT p.*, v.heart_rate, v.blood_pressure_systolic, v.blood_pressure_diastolic,
-                   v.temperature, v.oxygen_saturation
-            FROM patients p
-            LEFT JOIN vitals v ON p.patient_id = v.patient_id
-        ''')
+        conn = get_db()
+        patient_count = conn.execute('SELECT COUNT(*) FROM patients').fetchone()[0]
         
-        patients = cursor.fetchall()
-        conn.close()
-        
-        if len(patients) < 10:
+        if patient_count < 10:
             return jsonify({
                 'error': 'Need at least 10 patients to train models',
-                'currentCount': len(patients)
+                'currentCount': patient_count
             }), 400
         
-        # Convert to list of dicts
-        patient_data_list = [dict(patient) for patient in patients]
-        
-        # Train all models
-        results = predictor.train_all_models(patient_data_list)
-        
-        if results:
-            return jsonify({
-                'success': True,
-                'message': f'Trained 4 models on {len(patients)} patients',
-                'results': results,
-                'bestModel': predictor.active_model_name,
-                'bestAccuracy': round(predictor.model_accuracies[predictor.active_model_name], 4)
-            })
-        else:
-            return jsonify({'error': 'Model training failed'}), 500
+        job_id = submit_job('train', _train_models, candidates, time_budget)
+        return job_accepted(job_id)
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _train_models(progress, candidates=None, time_budget=None):
+    """Background job: train all candidate models on the current patients"""
+    conn = get_db_connection()
+    try:
+        patients = conn.execute(PATIENTS_WITH_VITALS).fetchall()
+    finally:
+        conn.close()
+    progress(0, 1)
+    
+    # Convert to list of dicts
+    patient_data_list = [dict(patient) for patient in patients]
+    
+    # Train all models
+    results = predictor.train_all_models(patient_data_list, candidates, time_budget)
+    if not results:
+        raise RuntimeError('Model training failed')
+    progress(1, 1)
+    active = predictor.active
+    
+    return {
+        'success': True,
+        'message': f'Trained {len(results)} models on {len(patients)} patients',
+        'results': results,
+        'trainingSeconds': predictor.training_times,
+        'bestModel': active.name,
+        'bestAccuracy': round(active.accuracies[active.name], 4),
+        'modelVersion': active.version
+    }
+
 @patients_bp.route('/api/ml/comparison', methods=['GET'])
 def get_model_comparison():
     """Get comparison of all trained models"""
@@ -246,7 +369,8 @@ def get_model_comparison():
         return jsonify({
             'trained': True,
             'models': comparison,
-            'activeModel': predictor.active_model_name
+            'activeModel': predictor.active_model_name,
+            'modelVersion': predictor.model_version
         })
     
     except Exception as e:
@@ -254,77 +378,40 @@ def get_model_comparison():
 
 @patients_bp.route('/api/patients/calculate-risks', methods=['POST'])
 def calculate_all_risks():
-    """Manually trigger risk calculation for all patients"""
+    """Manually trigger risk calculation for patients whose scores are out of date"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT p.*, v.heart_rate, v.blood_pressure_systolic, v.blood_pressure_diastolic,
-                   v.temperature, v.oxygen_saturation
-            FROM patients p
-            LEFT JOIN vitals v ON p.patient_id = v.patient_id
-        ''')
+        data = request.get_json(silent=True) or {}
+        force_full = bool(data.get('forceFull', False))
         
-        patients = cursor.fetchall()
-        updated = 0
-        
-        for patient in patients:
-            patient_dict = dict(patient)
-            try:
-                prediction = predictor.predict(patient_dict)
-                
-                cursor.execute('''
-                    UPDATE patients 
-                    SET risk_score = ?, risk_level = ?
-                    WHERE patient_id = ?
-                ''', (prediction['riskScore'], prediction['riskLevel'], patient_dict['patient_id']))
-                updated += 1
-            except Exception as e:
-                print(f"Error calculating risk for {patient_dict.get('patient_id')}: {e}")
-        
-        conn.commit()
-        conn.close()
-        
-        return jsonify({
-            'success': True,
-            'patientsUpdated': updated,
-            'message': f'Calculated risk scores for {updated} patients'
-        })
+        job_id = submit_job('calculate-risks', _calculate_risks, force_full)
+        return job_accepted(job_id)
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _calculate_risks(progress, force_full):
+    """Background job: rescore out-of-date (or all) patients"""
+    conn = get_db_connection()
+    try:
+        updated = rescore_patients(conn, force_full=force_full, progress=progress)
+    finally:
+        conn.close()
+    
+    return {
+        'success': True,
+        'patientsUpdated': updated,
+        'message': f'Calculated risk scores for {updated} patients'
+    }
+
 @patients_bp.route('/api/data/load-demo', methods=['POST'])
 def load_demo_data():
     """Load demo patient data"""
     try:
         generate_demo_data(50)
         
-        # Calculate risk scores for all patients
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT p.*, v.heart_rate, v.blood_pressure_systolic, v.blood_pressure_diastolic,
-                   v.temperature, v.oxygen_saturation
-            FROM patients p
-            LEFT JOIN vitals v ON p.patient_id = v.patient_id
-        ''')
-        
-        patients = cursor.fetchall()
-        for patient in patients:
-            patient_dict = dict(patient)
-            prediction = predictor.predict(patient_dict)
-            
-            cursor.execute('''
-                UPDATE patients 
-                SET risk_score = ?, risk_level = ?
-                WHERE patient_id = ?
-            ''', (prediction['riskScore'], prediction['riskLevel'], patient_dict['patient_id']))
-        
-        conn.commit()
-        conn.close()
+        # Score anything the generator could not (it scores the new patients itself)
+        conn = get_db()
+        rescore_patients(conn)
         
         return jsonify({
             'success': True,
@@ -338,16 +425,22 @@ def load_demo_data():
 def delete_patient(patient_id):
     """Delete a specific patient"""
     try:
-        conn = get_db_connection()
+        conn = get_db()
         cursor = conn.cursor()
         
         # Delete related records first
+        digests = [
+            row['content_hash'] for row in
+            cursor.execute('SELECT content_hash FROM notes WHERE patient_id = ?', (patient_id,))
+            if row['content_hash']
+        ]
         cursor.execute('DELETE FROM notes WHERE patient_id = ?', (patient_id,))
         cursor.execute('DELETE FROM vitals WHERE patient_id = ?', (patient_id,))
         cursor.execute('DELETE FROM patients WHERE patient_id = ?', (patient_id,))
         
         conn.commit()
-        conn.close()
+        prune_note_analyses(conn, digests)
+        bump_data_generation(conn)
         
         return jsonify({
             'success': True,
@@ -361,7 +454,7 @@ def delete_patient(patient_id):
 def clear_all_data():
     """Clear all patient data from database"""
     try:
-        conn = get_db_connection()
+        conn = get_db()
         cursor = conn.cursor()
         
         # Delete all records
@@ -370,7 +463,8 @@ def clear_all_data():
         cursor.execute('DELETE FROM patients')
         
         conn.commit()
-        conn.close()
+        prune_note_analyses(conn)
+        bump_data_generation(conn)
         
         return jsonify({
             'success': True,
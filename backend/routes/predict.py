@@ -3,8 +3,11 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from models.database import get_db_connection
+from models.database import get_db, get_db_connection, PATIENTS_WITH_VITALS
 from ml.risk_predictor import predictor
+from ml.scoring import rescore_patients, stored_prediction
+from models.jobs import submit_job
+from routes.jobs import job_accepted
 
 predict_bp = Blueprint('predict', __name__)
 
@@ -20,23 +23,21 @@ def predict_risk():
     if 'patientId' in data:
         patient_id = data['patientId']
         
-        conn = get_db_connection()
+        conn = get_db()
         cursor = conn.cursor()
         
-        cursor.execute('''
-            SELECT p.*, v.heart_rate, v.blood_pressure_systolic, v.blood_pressure_diastolic,
-                   v.temperature, v.oxygen_saturation
-            FROM patients p
-            LEFT JOIN vitals v ON p.patient_id = v.patient_id
-            WHERE p.patient_id = ?
-        ''', (patient_id,))
+        cursor.execute(PATIENTS_WITH_VITALS + ' WHERE p.patient_id = ?', (patient_id,))
         
         row = cursor.fetchone()
-        conn.close()
         
         if not row:
             return jsonify({'error': 'Patient not found'}), 404
         
+        # Served from the last rescore when the stored score is up to date
+        stored = stored_prediction(conn, row)
+        if stored is not None:
+            return jsonify(stored)
+        
         patient_data = dict(row)
     else:
         # Use provided patient data
@@ -48,42 +49,33 @@ def predict_risk():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@predict_bp.route('/api/predict/cache', methods=['GET'])
+def prediction_cache_stats():
+    """Size and hit/miss counters of this worker's prediction cache"""
+    return jsonify(predictor.prediction_cache.stats())
+
 @predict_bp.route('/api/predict/batch', methods=['POST'])
 def predict_batch():
-    """Calculate risk scores for all patients"""
+    """Calculate risk scores for all patients whose scores are out of date (as a background job)"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT p.*, v.heart_rate, v.blood_pressure_systolic, v.blood_pressure_diastolic,
-                   v.temperature, v.oxygen_saturation
-            FROM patients p
-            LEFT JOIN vitals v ON p.patient_id = v.patient_id
-        ''')
-        
-        patients = cursor.fetchall()
-        updated_count = 0
-        
-        for patient in patients:
-            patient_dict = dict(patient)
-            prediction = predictor.predict(patient_dict)
-            
-            cursor.execute('''
-                UPDATE patients 
-                SET risk_score = ?, risk_level = ?
-                WHERE patient_id = ?
-            ''', (prediction['riskScore'], prediction['riskLevel'], patient_dict['patient_id']))
-            
-            updated_count += 1
+        data = request.get_json(silent=True) or {}
+        force_full = bool(data.get('forceFull', False))
         
-        conn.commit()
-        conn.close()
-        
-        return jsonify({
-            'success': True,
-            'patientsUpdated': updated_count
-        })
+        job_id = submit_job('predict-batch', _predict_batch, force_full)
+        return job_accepted(job_id)
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+
+def _predict_batch(progress, force_full):
+    """Background job: rescore out-of-date (or all) patients"""
+    conn = get_db_connection()
+    try:
+        updated_count = rescore_patients(conn, force_full=force_full, progress=progress)
+    finally:
+        conn.close()
+    
+    return {
+        'success': True,
+        'patientsUpdated': updated_count
+    }
@@ -0,0 +1,45 @@
+from flask import Blueprint, jsonify
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ml.model_registry import registry
+from ml.risk_predictor import predictor
+
+registry_bp = Blueprint('registry', __name__)
+
+@registry_bp.route('/api/ml/versions', methods=['GET'])
+def list_model_versions():
+    """List registered model versions (newest first) and the active one"""
+    try:
+        return jsonify({
+            'activeVersion': registry.active_version(),
+            'versions': registry.list_versions()
+        })
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@registry_bp.route('/api/ml/versions/<version>/promote', methods=['POST'])
+def promote_model_version(version):
+    """Make a registered model version active in every worker"""
+    try:
+        predictor.promote(version)
+        return jsonify({'success': True, 'activeVersion': version})
+    
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@registry_bp.route('/api/ml/rollback', methods=['POST'])
+def rollback_model_version():
+    """Re-activate the model version that was active before the current one"""
+    try:
+        version = predictor.rollback()
+        return jsonify({'success': True, 'activeVersion': version})
+    
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 409
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
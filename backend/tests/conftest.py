@@ -0,0 +1,29 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+from flask import Flask
+
+from benchmarks.query_plans import seed_patients
+from models import database
+from routes.patients import patients_bp
+
+PATIENTS = 5000
+
+@pytest.fixture(scope='module')
+def conn(tmp_path_factory):
+    database.DATABASE_PATH = str(tmp_path_factory.mktemp('db') / 'healthcare.db')
+    database.init_database()
+    conn = database.get_pooled_connection()
+    seed_patients(conn, PATIENTS, np.random.default_rng(42))
+    return conn
+
+@pytest.fixture(scope='module')
+def client(conn):
+    app = Flask(__name__)
+    database.init_app(app)
+    app.register_blueprint(patients_bp)
+    return app.test_client()
@@ -0,0 +1,82 @@
+"""Compiled and fused models must reproduce predict_proba and add up to it"""
+
+import numpy as np
+import pytest
+from sklearn.preprocessing import StandardScaler
+
+from benchmarks.compiled_inference import synthetic_patients, threshold_rows
+from ml.compiled_model import CompiledLinearModel, compile_model, export_fused_model
+from ml.model_selection import build_estimator
+from ml.risk_predictor import MODEL_CANDIDATES, predictor
+
+# Folding the scaler into the weights changes a dot product's rounding;
+# contributions add up in a different order than the model sums them
+LINEAR_TOLERANCE = 1e-15
+ADDITIVITY_TOLERANCE = 1e-12
+
+@pytest.fixture(scope='module')
+def data():
+    rng = np.random.default_rng(42)
+    X_train, _ = predictor.extract_feature_matrix(synthetic_patients(2000, rng))
+    noise = rng.normal(scale=8, size=len(X_train))
+    y_train = (predictor.calculate_risk_scores(X_train) + noise >= 60).astype(int)
+    X_score, _ = predictor.extract_feature_matrix(synthetic_patients(500, rng))
+    return X_train, y_train, X_score
+
+@pytest.fixture(scope='module', params=sorted(MODEL_CANDIDATES))
+def fitted(request, data):
+    X_train, y_train, _ = data
+    estimator_path, params = MODEL_CANDIDATES[request.param]
+    params = {**params, 'n_jobs': 1} if 'n_jobs' in params else params
+    if 'n_estimators' in params:
+        params = {**params, 'n_estimators': 20}
+    scaler = StandardScaler().fit(X_train)
+    model = build_estimator(estimator_path, params).fit(scaler.transform(X_train), y_train)
+    return model, scaler
+
+def test_compiled_matches_predict_proba(fitted, data):
+    model, scaler = fitted
+    _, _, X = data
+    compiled = compile_model(model)
+    fused = export_fused_model(model, scaler)
+    assert compiled is not None and fused is not None
+    
+    if not isinstance(fused, CompiledLinearModel):
+        X = np.concatenate([X, threshold_rows(fused, X)])
+    expected = model.predict_proba(scaler.transform(X))[:, 1]
+    
+    if isinstance(fused, CompiledLinearModel):
+        np.testing.assert_allclose(compiled.predict_proba(scaler.transform(X)), expected, rtol=0, atol=LINEAR_TOLERANCE)
+        np.testing.assert_allclose(fused.predict_proba(X), expected, rtol=0, atol=LINEAR_TOLERANCE)
+    else:
+        np.testing.assert_array_equal(compiled.predict_proba(scaler.transform(X)), expected)
+        np.testing.assert_array_equal(fused.predict_proba(X), expected)
+
+def test_contributions_add_up_to_prediction(fitted, data):
+    model, scaler = fitted
+    _, _, X = data
+    fused = export_fused_model(model, scaler)
+    
+    # Small batches gather path contributions, large ones (> BLOCK_ROWS) use a sparse product
+    for batch in (X[:10], X):
+        # Forests and single trees add up in probability, boosting and logistic regression in log-odds
+        if isinstance(fused, CompiledLinearModel) or fused.combine == 'boosting':
+            expected = model.decision_function(scaler.transform(batch))
+        else:
+            expected = model.predict_proba(scaler.transform(batch))[:, 1]
+        np.testing.assert_allclose(
+            fused.baseline() + fused.contributions(batch).sum(axis=1), expected, rtol=0, atol=ADDITIVITY_TOLERANCE
+        )
+
+def test_path_contributions_add_up_to_node_values(fitted):
+    model, scaler = fitted
+    fused = export_fused_model(model, scaler)
+    if isinstance(fused, CompiledLinearModel):
+        pytest.skip('linear models have no split paths')
+    
+    # Each node's path credit is its value less the value of its tree's root
+    table = fused.path_contributions(scaler.n_features_in_)
+    tree_of_node = np.searchsorted(fused.roots, np.arange(len(fused.value)), side='right') - 1
+    np.testing.assert_allclose(
+        table.sum(axis=1), fused.value - fused.value[fused.roots[tree_of_node]], rtol=0, atol=ADDITIVITY_TOLERANCE
+    )
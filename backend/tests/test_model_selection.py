@@ -0,0 +1,44 @@
+"""Successive halving on small and imbalanced training sets"""
+
+import numpy as np
+import pytest
+
+from ml.model_selection import _stratified_order, small_data_search, successive_halving
+
+CONFIGS = [
+    ('sklearn.linear_model.LogisticRegression', {'C': 1.0}),
+    ('sklearn.linear_model.LogisticRegression', {'C': 0.1}),
+    ('sklearn.tree.DecisionTreeClassifier', {'max_depth': 3, 'random_state': 42})
+]
+
+def imbalanced(n, n_positive, seed=0):
+    rng = np.random.default_rng(seed)
+    y = np.zeros(n, dtype=int)
+    y[rng.choice(n, n_positive, replace=False)] = 1
+    X = rng.normal(size=(n, 3)) + y[:, None]
+    return X, y
+
+def test_stratified_order_keeps_class_share():
+    _, y = imbalanced(1000, 50)
+    order = _stratified_order(y, 42)
+    assert sorted(order) == list(range(len(y)))
+    assert set(y[order[:2]]) == {0, 1}
+    for n_rows in (20, 100, 333):
+        assert abs(y[order[:n_rows]].mean() - y.mean()) <= 1 / n_rows
+
+def test_rungs_of_rare_positives_fit_every_config():
+    # 4 positives in 3000 rows: a random 333-row first rung would often have none
+    configs = [('sklearn.linear_model.LogisticRegression', {'C': C}) for C in np.logspace(-2, 2, 27)]
+    X, y = imbalanced(3000, 4)
+    search = successive_halving(configs, X, y, min_rows=100)
+    assert [rung['rows'] for rung in search.rungs] == [333, 1000, 3000]
+    assert sorted(search.scores) == list(range(len(configs)))
+
+def test_single_class_is_rejected():
+    X, y = imbalanced(200, 0)
+    with pytest.raises(ValueError):
+        successive_halving(CONFIGS, X, y)
+
+def test_small_data_is_not_searched():
+    assert small_data_search(40)
+    assert not small_data_search(20000)
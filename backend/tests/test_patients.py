@@ -0,0 +1,55 @@
+"""GET /api/patients cursor handling"""
+
+import base64
+import io
+import json
+import tempfile
+
+import pytest
+
+from routes import patients
+
+def encoded(key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+@pytest.mark.parametrize('cursor', [
+    'not base64!',
+    encoded({'sort': 1, 'id': 2}),
+    encoded([1]),
+    encoded([1, 2, 3]),
+    encoded([[1], 2]),
+    encoded([{'a': 1}, 2]),
+    encoded([True, 2]),
+    encoded([1, '2']),
+    encoded([1, 2.0]),
+    encoded([1, True]),
+    encoded([1, None]),
+    encoded([2 ** 63, 2]),
+    encoded([1, 2 ** 63])
+])
+def test_invalid_cursor_is_rejected(client, cursor):
+    response = client.get('/api/patients', query_string={'sort': 'risk', 'cursor': cursor})
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Invalid cursor'}
+
+@pytest.mark.parametrize('sort', ['risk', 'date', 'name'])
+def test_next_cursor_continues_the_order(client, sort):
+    # Read each streamed page before the next request opens its own context
+    first = client.get('/api/patients', query_string={'sort': sort, 'limit': 20})
+    ids = [patient['id'] for patient in first.get_json()]
+    second = client.get('/api/patients', query_string={
+        'sort': sort, 'limit': 20, 'cursor': first.headers['X-Next-Cursor']
+    })
+    ids += [patient['id'] for patient in second.get_json()]
+    whole = client.get('/api/patients', query_string={'sort': sort, 'limit': 40})
+    assert ids == [patient['id'] for patient in whole.get_json()]
+
+def test_upload_removes_spooled_file_when_not_queued(client, monkeypatch, tmp_path):
+    def submit_job(*args):
+        raise RuntimeError('job queue is full')
+    
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path))
+    monkeypatch.setattr(patients, 'submit_job', submit_job)
+    response = client.post('/api/data/upload', data={'file': (io.BytesIO(b'patient_id\nP1\n'), 'patients.csv')})
+    assert response.status_code == 500
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,56 @@
+"""Hot queries and keyset cursor queries must seek an index, not scan"""
+
+import pytest
+
+from models import database
+from routes.patients import _encode_cursor
+
+PAGES = 4
+
+def cursor_queries(conn, client, args):
+    """Follow X-Next-Cursor for PAGES pages and return the SELECTs run by pages fetched with a cursor"""
+    # The trace callback sees each statement with its parameters inlined
+    statements = []
+    queries = {}
+    conn.set_trace_callback(statements.append)
+    try:
+        for page in range(PAGES):
+            statements.clear()
+            response = client.get('/api/patients', query_string=args)
+            assert response.status_code == 200
+            response.get_data()
+            if 'cursor' in args:
+                queries.update(
+                    (f'page {page}: {sql}', (sql, ()))
+                    for sql in statements if sql.lstrip().upper().startswith('SELECT')
+                )
+            if 'X-Next-Cursor' not in response.headers:
+                break
+            args = {**args, 'cursor': response.headers['X-Next-Cursor']}
+    finally:
+        conn.set_trace_callback(None)
+    return queries
+
+@pytest.mark.parametrize('name', sorted(database.HOT_QUERIES))
+def test_hot_query_plan(conn, name):
+    assert database.audit_query_plans(conn, {name: database.HOT_QUERIES[name]}) == []
+
+@pytest.mark.parametrize('sort', ['risk', 'date', 'name'])
+@pytest.mark.parametrize('risk', [None, 'high'])
+def test_cursor_query_plans(conn, client, sort, risk):
+    args = {'sort': sort, 'limit': 50}
+    if risk:
+        args['risk'] = risk
+    queries = cursor_queries(conn, client, args)
+    assert queries
+    assert database.audit_query_plans(conn, queries, ordered_scans=set()) == []
+
+def test_null_risk_tail_query_plans(conn, client):
+    # Start just before the unscored patients so the pages cross into the NULL tail
+    lowest = conn.execute(
+        'SELECT risk_score, id FROM patients WHERE risk_score IS NOT NULL ORDER BY risk_score, id DESC LIMIT 1 OFFSET 10'
+    ).fetchone()
+    args = {'sort': 'risk', 'limit': 50, 'cursor': _encode_cursor(lowest['risk_score'], lowest['id'])}
+    queries = cursor_queries(conn, client, args)
+    assert any('IS NULL' in query for query in queries)
+    assert database.audit_query_plans(conn, queries, ordered_scans=set()) == []
@@ -7,7 +7,7 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from models.database import get_db_connection
+from models.database import get_db_connection, PATIENTS_WITH_VITALS
 from ml.risk_predictor import predictor
 
 def train_model():
@@ -19,12 +19,7 @@ def train_model():
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    cursor.execute('''
-        SELECT p.*, v.heart_rate, v.blood_pressure_systolic, v.blood_pressure_diastolic,
-               v.temperature, v.oxygen_saturation
-        FROM patients p
-        LEFT JOIN vitals v ON p.patient_id = v.patient_id
-    ''')
+    cursor.execute(PATIENTS_WITH_VITALS)
     
     patients = cursor.fetchall()
     conn.close()
@@ -45,8 +40,8 @@ def train_model():
     if success:
         print("\n" + "=" * 50)
         print("✅ Model training complete!")
-        print(f"📈 Model Accuracy: {predictor.model_accuracy:.2%}")
-        print("💾 Model saved to: risk_model.pkl")
+        print(f"📈 Best Model: {predictor.active_model_name} ({predictor.model_accuracies[predictor.active_model_name]:.2%} accuracy)")
+        print(f"💾 Model registered and promoted as version {predictor.model_version}")
         print("\n🎯 Your platform now uses REAL Machine Learning!")
         print("=" * 50)
     else:
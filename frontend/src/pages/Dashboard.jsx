@@ -4,7 +4,6 @@ import {
   BarChart, Bar, XAxis, YAxis, CartesianGrid, Tooltip, ResponsiveContainer,
   PieChart, Pie, Cell, LineChart, Line, Legend
 } from 'recharts'
-import axios from 'axios'
 
 const COLORS = ['#3B82F6', '#10B981', '#F59E0B', '#EF4444', '#8B5CF6', '#EC4899', '#14B8A6', '#F97316']
 
@@ -25,21 +24,14 @@ export default function Dashboard() {
 
   const fetchData = async () => {
     try {
-      const API_URL = import.meta.env.VITE_API_URL || 'http://localhost:5000'
-      const [metricsRes, distRes, ageRes, diagRes, timelineRes, riskAgeRes] = await Promise.all([
-        dashboardAPI.getMetrics(),
-        dashboardAPI.getRiskDistribution(),
-        axios.get(`${API_URL}/api/dashboard/age-distribution`),
-        axios.get(`${API_URL}/api/dashboard/diagnosis-breakdown`),
-        axios.get(`${API_URL}/api/dashboard/admissions-timeline`),
-        axios.get(`${API_URL}/api/dashboard/risk-by-age`)
-      ])
-      setMetrics(metricsRes.data)
-      setDistribution(distRes.data)
-      setAgeDistribution(ageRes.data)
-      setDiagnosisBreakdown(diagRes.data)
-      setAdmissionsTimeline(timelineRes.data)
-      setRiskByAge(riskAgeRes.data)
+      // One request for every chart; served from the server-side cache until data changes
+      const { data } = await dashboardAPI.getSummary()
+      setMetrics(data.metrics)
+      setDistribution(data.riskDistribution)
+      setAgeDistribution(data.ageDistribution)
+      setDiagnosisBreakdown(data.diagnosisBreakdown)
+      setAdmissionsTimeline(data.admissionsTimeline)
+      setRiskByAge(data.riskByAge)
     } catch (error) {
       console.error('Error fetching dashboard data:', error)
     } finally {
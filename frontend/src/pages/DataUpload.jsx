@@ -1,5 +1,5 @@
 import { useState } from 'react'
-import { patientsAPI } from '../services/api'
+import { patientsAPI, jobsAPI } from '../services/api'
 import { useNavigate } from 'react-router-dom'
 
 export default function DataUpload() {
@@ -30,8 +30,11 @@ export default function DataUpload() {
       const response = await patientsAPI.uploadCSV(file)
       console.log('Upload response:', response.data)
       
+      setMessage('Processing upload...')
+      const result = await jobsAPI.waitFor(response.data.jobId)
+      
       setUploadStatus('success')
-      setMessage(`Successfully uploaded ${response.data.recordsProcessed} records!`)
+      setMessage(`Successfully uploaded ${result.recordsProcessed} records!`)
       setFile(null)
       
       setTimeout(() => {
@@ -75,7 +78,8 @@ export default function DataUpload() {
       const response = await fetch(`${API_URL}/api/patients/calculate-risks`, {
         method: 'POST'
       })
-      const data = await response.json()
+      const job = await response.json()
+      const data = await jobsAPI.waitFor(job.jobId)
       
       setUploadStatus('success')
       setMessage(`Calculated risk scores for ${data.patientsUpdated} patients!`)
@@ -99,7 +103,13 @@ export default function DataUpload() {
       const response = await fetch(`${API_URL}/api/ml/train`, {
         method: 'POST'
       })
-      const data = await response.json()
+      const job = await response.json()
+      if (!job.jobId) {
+        setUploadStatus('error')
+        setMessage(job.error || 'Training failed')
+        return
+      }
+      const data = await jobsAPI.waitFor(job.jobId)
       
       if (data.success) {
         setUploadStatus('success')
@@ -14,6 +14,7 @@ const api = axios.create({
 })
 
 export const dashboardAPI = {
+  getSummary: () => api.get('/api/dashboard/summary'),
   getMetrics: () => api.get('/api/dashboard/metrics'),
   getRiskDistribution: () => api.get('/api/dashboard/risk-distribution')
 }
@@ -38,7 +39,21 @@ export const predictAPI = {
 }
 
 export const notesAPI = {
-  analyze: (noteText) => api.post('/api/notes/analyze', { noteText })
+  analyze: (noteText) => api.post('/api/notes/analyze', { noteText }),
+  analyzeBatch: (notes) => api.post('/api/notes/analyze-batch', { notes })
+}
+
+export const jobsAPI = {
+  get: (jobId) => api.get(`/api/jobs/${jobId}`),
+  // Poll a background job until it finishes; resolves with its result
+  waitFor: async (jobId, intervalMs = 1000) => {
+    while (true) {
+      const { data } = await api.get(`/api/jobs/${jobId}`)
+      if (data.status === 'succeeded') return data.result
+      if (data.status === 'failed') throw new Error(data.error || 'Job failed')
+      await new Promise((resolve) => setTimeout(resolve, intervalMs))
+    }
+  }
 }
 
 export default api